@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from retellclient.models import operations
+
+
+class CallRegistrar:
+    """
+    Registers Retell calls off the event loop, within a strict time budget.
+
+    The Retell SDK is synchronous, so registration runs on a small thread pool
+    (sharing the SDK's pooled connections) and the webhook only awaits it. With
+    `pool_size` > 0, call IDs are registered ahead of time per agent, so an
+    inbound call can be answered without any Retell round trip.
+
+    A registration that misses the budget keeps running and is held for the
+    same call (by Twilio CallSid), so the webhook's retry picks it up instead
+    of registering again.
+    """
+
+    def __init__(self, retell, timeout=None, max_workers=None, pool_size=None, pool_max_age=None):
+        self.retell = retell
+        self.timeout = timeout or float(os.getenv('RETELL_REGISTER_TIMEOUT', 5))
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv('RETELL_PREREGISTER_POOL_SIZE', 0))
+        # Pre-registered calls are only handed out while Retell still expects them to connect
+        self.pool_max_age = pool_max_age or float(os.getenv('RETELL_PREREGISTER_MAX_AGE', 30))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('RETELL_REGISTER_WORKERS', 8)),
+            thread_name_prefix="retell-register",
+        )
+        self.pools = {}
+        self._refilling = set()
+        # CallSid -> (agent_id, registration future, when it timed out)
+        self._late = {}
+
+    def _register_sync(self, agent_id):
+        call_response = self.retell.register_call(operations.RegisterCallRequestBody(
+            agent_id=agent_id,
+            audio_websocket_protocol="twilio",
+            audio_encoding="mulaw",
+            sample_rate=8000
+        ))
+        if not call_response.call_detail:
+            raise RuntimeError(f"Retell did not register a call for agent {agent_id}")
+        return call_response.call_detail.call_id
+
+    def _take_pooled(self, agent_id):
+        pool = self.pools.get(agent_id)
+        while pool:
+            call_id, registered_at = pool.popleft()
+            if time.monotonic() - registered_at < self.pool_max_age:
+                return call_id
+        return None
+
+    def _keep_for_later(self, agent_id, future):
+        # A registration that missed its deadline is still a valid call ID for the next caller
+        if self.pool_size > 0 and not future.cancelled() and future.exception() is None:
+            pool = self.pools.setdefault(agent_id, deque())
+            if len(pool) < self.pool_size:
+                pool.append((future.result(), time.monotonic()))
+
+    def _expire_late(self):
+        # Late registrations whose call never came back (the caller hung up) go to the pool, if any
+        now = time.monotonic()
+        for call_sid, (agent_id, future, timed_out_at) in list(self._late.items()):
+            if now - timed_out_at >= self.pool_max_age:
+                del self._late[call_sid]
+                future.add_done_callback(lambda f, agent_id=agent_id: self._keep_for_later(agent_id, f))
+
+    async def _claim_late(self, call_sid):
+        """
+        The call ID registered for `call_sid` after its first attempt timed out, or None.
+        """
+        agent_id, future, _ = self._late.pop(call_sid)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.add_done_callback(lambda f: self._keep_for_later(agent_id, f))
+            raise
+        except Exception as err:
+            print(f"Late registration for {call_sid} failed, registering again: {err}")
+            return None
+
+    async def register(self, agent_id, call_sid=None):
+        """
+        A call ID for `agent_id`, or asyncio.TimeoutError once the time budget is spent.
+
+        Parameters:
+            call_sid: Twilio's CallSid. When given, a registration that times out is
+                kept for this call, and the next register() with the same CallSid
+                waits for it rather than starting over.
+        """
+        self._expire_late()
+        call_id = None
+        if call_sid is not None and call_sid in self._late:
+            call_id = await self._claim_late(call_sid)
+        if call_id is None:
+            call_id = self._take_pooled(agent_id)
+        if call_id is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self._register_sync, agent_id)
+            try:
+                call_id = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                if call_sid is not None:
+                    self._late[call_sid] = (agent_id, future, time.monotonic())
+                else:
+                    future.add_done_callback(lambda f: self._keep_for_later(agent_id, f))
+                self.refill(agent_id)
+                raise
+        self.refill(agent_id)
+        return call_id
+
+    def refill(self, agent_id):
+        """
+        Top up the pre-registration pool for `agent_id` in the background.
+        """
+        if self.pool_size <= 0 or agent_id in self._refilling:
+            return
+        self._refilling.add(agent_id)
+        asyncio.get_running_loop().create_task(self._refill(agent_id))
+
+    async def _refill(self, agent_id):
+        loop = asyncio.get_running_loop()
+        pool = self.pools.setdefault(agent_id, deque())
+        try:
+            while True:
+                # Drop entries that aged out before anyone used them
+                while pool and time.monotonic() - pool[0][1] >= self.pool_max_age:
+                    pool.popleft()
+                if len(pool) >= self.pool_size:
+                    break
+                call_id = await loop.run_in_executor(self.executor, self._register_sync, agent_id)
+                if len(pool) >= self.pool_size:
+                    break
+                pool.append((call_id, time.monotonic()))
+        except Exception as err:
+            print(f"Error pre-registering calls for {agent_id}: {err}")
+        finally:
+            self._refilling.discard(agent_id)
+
+    async def keep_warm(self, agent_id, interval=None):
+        """
+        Keep the pool for `agent_id` full even when no calls come in, replacing expired entries.
+        """
+        interval = interval or self.pool_max_age / 2
+        while True:
+            self.refill(agent_id)
+            await asyncio.sleep(interval)
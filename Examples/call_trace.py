@@ -0,0 +1,99 @@
+import json
+import os
+import struct
+import time
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; records are then stored as compact JSON
+    msgpack = None
+
+# File header: magic, then one byte naming the codec of every record that follows
+MAGIC = b"CALLTRACE1"
+LENGTH = struct.Struct("!I")
+
+
+def _encode(record, codec):
+    if codec == b"m":
+        return msgpack.packb(record, use_bin_type=True)
+    return json.dumps(record, separators=(",", ":")).encode()
+
+
+def _decode(data, codec):
+    if codec == b"m":
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+class CallTraceRecorder:
+    """
+    Append-only record of one call: every inbound Retell message and every
+    outbound frame, as they were on the wire, with monotonic timestamps.
+
+    Each record is a length-prefixed [seconds since the call started,
+    "in" | "out", text] entry, so a trace cut short by a crash is still
+    readable up to its last complete record.
+    """
+
+    def __init__(self, path, call_id):
+        self.codec = b"m" if msgpack is not None else b"j"
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + self.codec)
+        self.started = time.monotonic()
+        self._write({"call_id": call_id, "started_at": time.time()})
+
+    @classmethod
+    def for_call(cls, call_id):
+        """
+        A recorder for `call_id` when CALL_TRACE_DIR is set, otherwise None.
+        """
+        directory = os.getenv('CALL_TRACE_DIR')
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"{call_id}.trace"), call_id)
+
+    def _write(self, record):
+        data = _encode(record, self.codec)
+        self.file.write(LENGTH.pack(len(data)) + data)
+        # One write() per record, so a crash loses at most the record being written
+        self.file.flush()
+
+    def record(self, direction, text):
+        if self.file.closed:
+            return  # a cancelled response still unwinding after the call ended
+        self._write([time.monotonic() - self.started, direction, text])
+
+    def wrap_send(self, send_text):
+        async def send_and_record(text):
+            await send_text(text)
+            self.record("out", text)
+        return send_and_record
+
+    def close(self):
+        self.file.close()
+
+
+def read_trace(path):
+    """
+    (header, records) of a trace; records are (seconds, direction, text) tuples.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a call trace")
+    codec = data[len(MAGIC):len(MAGIC) + 1]
+    if codec == b"m" and msgpack is None:
+        raise RuntimeError(f"{path} was recorded with msgpack: pip install msgpack")
+    offset = len(MAGIC) + 1
+    entries = []
+    while offset + LENGTH.size <= len(data):
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        if offset + length > len(data):
+            break  # last record was cut off mid-write
+        entries.append(_decode(data[offset:offset + length], codec))
+        offset += length
+    if not entries:
+        raise ValueError(f"{path} has no header record")
+    return entries[0], [tuple(entry) for entry in entries[1:]]
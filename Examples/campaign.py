@@ -0,0 +1,371 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+# Twilio call statuses after which the call no longer holds a concurrency slot
+# ("unknown": Twilio has no record of the call's SID, so nothing will ever update it)
+TERMINAL_STATES = ("completed", "busy", "no-answer", "canceled", "failed", "unknown")
+ACTIVE_STATES = ("dialing", "queued", "initiated", "ringing", "in-progress")
+# HTTP statuses worth another attempt: throttling and Twilio-side trouble
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CampaignStore:
+    """
+    SQLite record of every number in every campaign: its call state, attempts,
+    Twilio call SID and answering-machine outcome. The dialer and the webhook
+    server share it, so a restarted dialer picks up where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    campaign TEXT NOT NULL,
+                    to_number TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    call_sid TEXT,
+                    answered_by TEXT,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (campaign, to_number)
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS calls_by_sid ON calls (call_sid)")
+            db.execute("CREATE INDEX IF NOT EXISTS calls_by_state ON calls (campaign, state, next_attempt_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets the webhook server write while the dialer reads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def add_numbers(self, campaign, numbers):
+        now = time.time()
+        with self._connect() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO calls (campaign, to_number, updated_at) VALUES (?, ?, ?)",
+                [(campaign, number, now) for number in numbers],
+            )
+
+    def recover(self, campaign):
+        # A dial that never got a call SID may or may not have gone out; try it again
+        with self._connect() as db:
+            db.execute(
+                "UPDATE calls SET state = 'pending', updated_at = ? "
+                "WHERE campaign = ? AND state = 'dialing' AND call_sid IS NULL",
+                (time.time(), campaign),
+            )
+
+    def claim_next(self, campaign):
+        """
+        Move the next number that is due from pending to dialing: (to_number, attempt) or None.
+        """
+        db = self._connect()
+        now = time.time()
+        row = db.execute(
+            "SELECT to_number, attempts FROM calls WHERE campaign = ? AND state = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT 1",
+            (campaign, now),
+        ).fetchone()
+        if row is None:
+            return None
+        claimed = db.execute(
+            "UPDATE calls SET state = 'dialing', attempts = attempts + 1, updated_at = ? "
+            "WHERE campaign = ? AND to_number = ? AND state = 'pending'",
+            (now, campaign, row['to_number']),
+        ).rowcount
+        return (row['to_number'], row['attempts'] + 1) if claimed else None
+
+    def mark_placed(self, campaign, to_number, call_sid):
+        self._connect().execute(
+            "UPDATE calls SET state = 'queued', call_sid = ?, error = NULL, updated_at = ? "
+            "WHERE campaign = ? AND to_number = ?",
+            (call_sid, time.time(), campaign, to_number),
+        )
+
+    def mark_retry(self, campaign, to_number, error, delay):
+        self._connect().execute(
+            "UPDATE calls SET state = 'pending', error = ?, next_attempt_at = ?, updated_at = ? "
+            "WHERE campaign = ? AND to_number = ?",
+            (error, time.time() + delay, time.time(), campaign, to_number),
+        )
+
+    def mark_failed(self, campaign, to_number, error):
+        self._connect().execute(
+            "UPDATE calls SET state = 'failed', error = ?, updated_at = ? WHERE campaign = ? AND to_number = ?",
+            (error, time.time(), campaign, to_number),
+        )
+
+    def record_status(self, call_sid, status):
+        # Callbacks can arrive out of order; a finished call stays finished
+        self._connect().execute(
+            f"UPDATE calls SET state = ?, updated_at = ? WHERE call_sid = ? "
+            f"AND state NOT IN ({','.join('?' * len(TERMINAL_STATES))})",
+            (status, time.time(), call_sid, *TERMINAL_STATES),
+        )
+
+    def record_amd(self, call_sid, answered_by):
+        self._connect().execute(
+            "UPDATE calls SET answered_by = ?, updated_at = ? WHERE call_sid = ?",
+            (answered_by, time.time(), call_sid),
+        )
+
+    def active_calls(self, campaign):
+        return [
+            (row['to_number'], row['call_sid'])
+            for row in self._connect().execute(
+                f"SELECT to_number, call_sid FROM calls WHERE campaign = ? AND state IN ({','.join('?' * len(ACTIVE_STATES))})",
+                (campaign, *ACTIVE_STATES),
+            )
+        ]
+
+    def stale_calls(self, campaign, older_than):
+        """
+        Active calls with a SID that nothing has updated for `older_than` seconds: (to_number, call_sid).
+        """
+        return [
+            (row['to_number'], row['call_sid'])
+            for row in self._connect().execute(
+                f"SELECT to_number, call_sid FROM calls WHERE campaign = ? AND call_sid IS NOT NULL "
+                f"AND updated_at < ? AND state IN ({','.join('?' * len(ACTIVE_STATES))})",
+                (campaign, time.time() - older_than, *ACTIVE_STATES),
+            )
+        ]
+
+    def counts(self, campaign):
+        counts = {}
+        for row in self._connect().execute(
+            "SELECT state, answered_by, COUNT(*) AS n FROM calls WHERE campaign = ? GROUP BY state, answered_by",
+            (campaign,),
+        ):
+            counts[row['state']] = counts.get(row['state'], 0) + row['n']
+            if row['answered_by']:
+                counts[f"answered_by:{row['answered_by']}"] = counts.get(f"answered_by:{row['answered_by']}", 0) + row['n']
+        return counts
+
+    def pending_count(self, campaign):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM calls WHERE campaign = ? AND state = 'pending'", (campaign,)
+        ).fetchone()[0]
+
+
+class RateLimiter:
+    # Token bucket: at most `rate` calls per second, no bursts beyond `burst`
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+def is_transient(err):
+    status = getattr(err, "status", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    # No HTTP status at all: the request never got an answer (requests' errors are OSErrors too)
+    return isinstance(err, OSError)
+
+
+class CampaignDialer:
+    """
+    Dials every pending number of a campaign at no more than `calls_per_second`,
+    with at most `max_concurrent` calls in flight, retrying transient failures
+    with jittered exponential backoff up to `max_attempts` times.
+
+    `place_call(to_number)` places one call and returns its SID; the Twilio
+    status callbacks (handled by server.py) move calls out of the active states.
+    In case a callback is lost, `fetch_status(call_sid)` is asked about any
+    active call that has not changed for `stale_after` seconds. Once nothing is
+    left to dial, the dialer waits up to `drain_timeout` seconds for the calls
+    still in flight to finish.
+    """
+
+    def __init__(self, store, campaign, place_call, calls_per_second=1.0, max_concurrent=5, max_attempts=3,
+                 retry_base_delay=5.0, poll_interval=1.0, fetch_status=None, stale_after=120.0,
+                 drain_timeout=600.0):
+        self.store = store
+        self.campaign = campaign
+        self.place_call = place_call
+        self.fetch_status = fetch_status
+        self.rate_limiter = RateLimiter(calls_per_second)
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.drain_timeout = drain_timeout
+
+    def _refresh(self, calls):
+        if self.fetch_status is None:
+            return
+        for to_number, call_sid in calls:
+            if not call_sid:
+                continue
+            try:
+                status = self.fetch_status(call_sid)
+            except Exception as err:
+                if getattr(err, "status", None) != 404:
+                    print(f"Could not fetch status of {call_sid} ({to_number}): {err}")
+                    continue
+                # Twilio does not know this SID; left active, it would hold a slot forever
+                print(f"No record of {call_sid} ({to_number}), marking it unknown")
+                status = "unknown"
+            # Records the time even when the status is unchanged, so the call is not asked about again right away
+            self.store.record_status(call_sid, status)
+
+    def reconcile(self):
+        """
+        After a restart, ask Twilio about calls we still think are active, in case callbacks were missed.
+        """
+        self.store.recover(self.campaign)
+        self._refresh(self.store.active_calls(self.campaign))
+
+    def dial_one(self, to_number, attempt):
+        try:
+            call_sid = self.place_call(to_number)
+        except Exception as err:
+            if is_transient(err) and attempt < self.max_attempts:
+                delay = random.uniform(0.5, 1.0) * self.retry_base_delay * 2 ** (attempt - 1)
+                self.store.mark_retry(self.campaign, to_number, str(err), delay)
+                print(f"Retrying {to_number} in {delay:.0f}s: {err}")
+            else:
+                self.store.mark_failed(self.campaign, to_number, str(err))
+                print(f"Giving up on {to_number}: {err}")
+            return None
+        self.store.mark_placed(self.campaign, to_number, call_sid)
+        print(f"Dialed {to_number}: {call_sid}")
+        return call_sid
+
+    def run(self):
+        self.reconcile()
+        while True:
+            if len(self.store.active_calls(self.campaign)) >= self.max_concurrent:
+                # A lost callback would otherwise hold its slot forever
+                self._refresh(self.store.stale_calls(self.campaign, self.stale_after))
+                time.sleep(self.poll_interval)
+                continue
+            self.rate_limiter.acquire()
+            claimed = self.store.claim_next(self.campaign)
+            if claimed is None:
+                if self.store.pending_count(self.campaign) == 0:
+                    self.drain()
+                    break
+                time.sleep(self.poll_interval)  # only retries scheduled for later remain
+                continue
+            self.dial_one(*claimed)
+        return self.store.counts(self.campaign)
+
+    def drain(self):
+        """
+        Wait for the calls still in flight, so the campaign ends with their outcomes recorded.
+        """
+        deadline = time.monotonic() + self.drain_timeout
+        while True:
+            active = self.store.active_calls(self.campaign)
+            if not active:
+                return
+            if time.monotonic() >= deadline:
+                print(f"{len(active)} calls still active after {self.drain_timeout:.0f}s; rerun the campaign to reconcile them")
+                return
+            self._refresh(self.store.stale_calls(self.campaign, self.stale_after))
+            time.sleep(self.poll_interval)
+
+
+def read_numbers(path):
+    """
+    Phone numbers from a CSV (a phone_number/to column, or the first column) or a JSONL file.
+    """
+    numbers = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    numbers.append(record.get('phone_number') or record['to'])
+            return numbers
+        rows = list(csv.reader(f))
+    if not rows:
+        return numbers
+    header = [column.strip().lower() for column in rows[0]]
+    column = next((header.index(name) for name in ("phone_number", "to", "number") if name in header), None)
+    if column is None:
+        column, body = 0, rows
+    else:
+        body = rows[1:]
+    return [row[column].strip() for row in body if row and row[column].strip()]
+
+
+def main(argv=None):
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description="Dial a list of numbers through the Retell agent.")
+    parser.add_argument("numbers", help="CSV or JSONL file of numbers to call")
+    parser.add_argument("--campaign", required=True, help="Campaign name; rerun with the same name to resume")
+    parser.add_argument("--from-number", required=True)
+    parser.add_argument("--agent-id", default=os.getenv('RETELL_AGENT_ID'))
+    parser.add_argument("--db", default=os.getenv('CAMPAIGN_DB', "campaign.db"))
+    parser.add_argument("--cps", type=float, default=1.0, help="Calls placed per second")
+    parser.add_argument("--max-concurrent", type=int, default=5)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--drain-timeout", type=float, default=600.0,
+                        help="Seconds to wait for calls in flight once every number has been dialed")
+    parser.add_argument("--stale-after", type=float, default=120.0,
+                        help="Ask Twilio about active calls with no status callback for this many seconds")
+    parser.add_argument("--fake", action="store_true", help="Dial against the local Twilio stand-in")
+    args = parser.parse_args(argv)
+
+    store = CampaignStore(args.db)
+    store.add_numbers(args.campaign, read_numbers(args.numbers))
+
+    if args.fake:
+        from fake_twilio import FakeTwilioClient
+        webhook_base_url = os.getenv('FAKE_TWILIO_WEBHOOK_URL')
+        twilio_client = FakeTwilioClient(
+            store=None if webhook_base_url else store,
+            webhook_base_url=webhook_base_url,
+            agent_id=args.agent_id,
+        )
+    else:
+        from twilio_server import TwilioClient
+        twilio_client = TwilioClient()
+
+    dialer = CampaignDialer(
+        store,
+        args.campaign,
+        place_call=lambda to_number: twilio_client.place_phone_call(args.from_number, to_number, args.agent_id).sid,
+        fetch_status=twilio_client.fetch_call_status,
+        calls_per_second=args.cps,
+        max_concurrent=args.max_concurrent,
+        max_attempts=args.max_attempts,
+        stale_after=args.stale_after,
+        drain_timeout=args.drain_timeout,
+    )
+    print(json.dumps(dialer.run(), indent=4))
+
+
+if __name__ == "__main__":
+    main()
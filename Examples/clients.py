@@ -0,0 +1,131 @@
+import asyncio
+import functools
+import os
+import httpx
+import requests
+import retellclient
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+from urllib3.util.retry import Retry
+
+# Per-endpoint budgets in seconds: (connect, read) for requests, a single total for Twilio
+ENDPOINT_TIMEOUTS = {
+    "retell": (3.0, 10.0),
+    "twilio": 15.0,
+}
+OPENAI_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+
+class TimeoutSession(requests.Session):
+    # The Retell SDK never passes a timeout, so default one in for every request
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def jittered_retry(total=3):
+    """
+    urllib3 retry policy: connection errors and throttling are retried with
+    exponential, jittered backoff. POSTs are not retried on 5xx because the
+    server may already have acted on them.
+    """
+    options = dict(
+        total=total,
+        connect=total,
+        read=0,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]),
+        backoff_factor=0.3,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=0.5, **options)
+    except TypeError:
+        # urllib3 < 2 has no jitter option
+        return Retry(**options)
+
+
+def pooled_session(endpoint):
+    session = TimeoutSession(ENDPOINT_TIMEOUTS[endpoint])
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', 20)),
+        max_retries=jittered_retry(),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+@functools.lru_cache(maxsize=None)
+def get_retell_client():
+    # One keep-alive pool per process instead of a fresh TLS handshake per request
+    return retellclient.RetellClient(
+        api_key=os.environ['RETELL_API_KEY'],
+        client=pooled_session("retell"),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_twilio_client():
+    http_client = TwilioHttpClient(pool_connections=True, timeout=ENDPOINT_TIMEOUTS["twilio"], max_retries=3)
+    return Client(os.environ['TWILIO_ACCOUNT_ID'], os.environ['TWILIO_AUTH_TOKEN'], http_client=http_client)
+
+
+def openai_pool_limits():
+    return httpx.Limits(
+        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', 100)),
+        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE', 20)),
+        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60)),
+    )
+
+
+# Keyed by PID: a worker forked from a process that already built a client gets its own pool
+@functools.lru_cache(maxsize=None)
+def _openai_client(pid):
+    return OpenAI(
+        organization=os.environ['OPENAI_ORGANIZATION_ID'],
+        api_key=os.environ['OPENAI_API_KEY'],
+        http_client=httpx.Client(limits=openai_pool_limits(), timeout=OPENAI_TIMEOUT),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _async_openai_client(pid, base_url=None, api_key=None):
+    return AsyncOpenAI(
+        organization=os.environ['OPENAI_ORGANIZATION_ID'],
+        api_key=api_key or os.environ['OPENAI_API_KEY'],
+        base_url=base_url,
+        http_client=httpx.AsyncClient(limits=openai_pool_limits(), timeout=OPENAI_TIMEOUT),
+    )
+
+
+def get_openai_client():
+    # Every call in this process shares one keep-alive pool to OpenAI
+    return _openai_client(os.getpid())
+
+
+def get_async_openai_client(base_url=None, api_key=None):
+    # base_url/api_key select another OpenAI-compatible endpoint, with a pool of its own
+    return _async_openai_client(os.getpid(), base_url, api_key)
+
+
+async def warm_openai_pool(connections=None):
+    """
+    Open `connections` keep-alive connections to OpenAI before the first call
+    arrives, so it does not pay for the TCP and TLS handshakes.
+    """
+    connections = connections if connections is not None else int(os.getenv('OPENAI_WARM_CONNECTIONS', 2))
+    client = get_async_openai_client()
+    # Concurrent requests each need their own connection, which then stays in the pool
+    results = await asyncio.gather(*(client.models.list() for _ in range(connections)), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        print(f"Could not warm {len(failures)} of {connections} OpenAI connections: {failures[0]}")
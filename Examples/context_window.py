@@ -0,0 +1,172 @@
+import asyncio
+import os
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to the ~4 characters per token rule of thumb
+    _encoding = None
+
+# Every chat message carries a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text)) + MESSAGE_OVERHEAD_TOKENS
+    return len(text) // 4 + 1 + MESSAGE_OVERHEAD_TOKENS
+
+
+def convert_utterance(utterance):
+    return {
+        "role": "assistant" if utterance["role"] == "agent" else "user",
+        "content": utterance['content'],
+    }
+
+
+# Lines worth keeping however long the call gets: what was ordered, how many, and where it goes
+KEY_DETAILS = re.compile(
+    r"\b(pizzas?|barbecue|bbq|garlic|tikka|olives?|mushrooms?|caramelized|onions?|eggplants?|small|medium|large|"
+    r"one|two|three|four|five|six|seven|eight|nine|ten|dozen|half|double|no|without|instead|cancel|remove|"
+    r"name|address|street|avenue|road|apartment|phone|number|deliver|delivery|pick ?up)\b|\d",
+    re.IGNORECASE,
+)
+
+
+def extractive_summary(previous_summary, messages, max_tokens):
+    """
+    Fallback compaction when no summarizer is configured: the lines of the
+    previous summary plus the dropped turns, clipped. What the caller said about
+    the order (KEY_DETAILS) is always kept, even past `max_tokens`, so it is never
+    lost; the remaining budget goes to the newest of the other lines.
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in messages:
+        speaker = "Agent" if message["role"] == "assistant" else "User"
+        lines.append(f"{speaker}: {message['content'][:200]}")
+    keep = set()
+    budget = max_tokens
+    for index, line in enumerate(lines):
+        if line.startswith("User: ") and KEY_DETAILS.search(line):
+            keep.add(index)
+            budget -= count_tokens(line)
+    for index in range(len(lines) - 1, -1, -1):
+        if index in keep:
+            continue
+        cost = count_tokens(lines[index])
+        if cost > budget:
+            break
+        keep.add(index)
+        budget -= cost
+    return "\n".join(line for index, line in enumerate(lines) if index in keep)
+
+
+class ConversationContext:
+    """
+    Per-call prompt state. Only utterances that are new (or still being spoken)
+    are converted on each turn, and the prompt handed to the model is kept under
+    `token_budget`: the system prompt and the most recent turns are kept as is,
+    older turns are folded into a running summary.
+
+    `summarizer`, if given, is an async callable (previous_summary, messages) -> str
+    run in the background, so compaction never sits on the response path.
+    """
+
+    def __init__(self, system_prompt, token_budget=None, keep_recent=None, summarizer=None):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.system_tokens = count_tokens(system_prompt)
+        self.token_budget = token_budget or int(os.getenv('LLM_CONTEXT_TOKEN_BUDGET', 2000))
+        self.keep_recent = keep_recent or int(os.getenv('LLM_CONTEXT_KEEP_RECENT', 6))
+        self.summary_budget = max(64, self.token_budget // 8)
+        self.summarizer = summarizer
+        self.messages = []
+        self.message_tokens = []
+        self.summary = ""
+        self.summarized = 0  # messages[:summarized] are covered by self.summary
+        self._summary_task = None
+
+    def update(self, transcript):
+        """
+        Bring the converted messages in line with the latest Retell transcript.
+        """
+        if len(transcript) < len(self.messages) or (
+            len(self.messages) > 1 and transcript[0]['content'] != self.messages[0]['content']
+        ):
+            # The transcript was rewritten rather than extended: start over
+            self.messages, self.message_tokens = [], []
+            self.summary, self.summarized = "", 0
+
+        # The last utterance we saw may still have been growing, so it is re-checked
+        start = max(0, len(self.messages) - 1)
+        for index in range(start, len(transcript)):
+            message = convert_utterance(transcript[index])
+            if index < len(self.messages):
+                if self.messages[index] == message:
+                    continue
+                self.messages[index] = message
+                self.message_tokens[index] = count_tokens(message['content'])
+            else:
+                self.messages.append(message)
+                self.message_tokens.append(count_tokens(message['content']))
+
+    def build(self):
+        """
+        The prompt for the next response, within the token budget.
+        """
+        used = self.system_tokens + (count_tokens(self._summary_content()) if self.summary else 0)
+
+        # Walk back from the newest turn; the last `keep_recent` turns are kept even over budget
+        min_kept = max(self.summarized, len(self.messages) - self.keep_recent)
+        first_kept = len(self.messages)
+        while first_kept > self.summarized:
+            cost = self.message_tokens[first_kept - 1]
+            if used + cost > self.token_budget and first_kept <= min_kept:
+                break
+            used += cost
+            first_kept -= 1
+
+        # Fold what no longer fits into the summary before the prompt is assembled. A background
+        # summary only advances `summarized` once it lands, so until then those turns stay in the prompt.
+        if first_kept > self.summarized:
+            self._compact(first_kept)
+
+        prompt = [self.system_message]
+        if self.summary:
+            prompt.append({"role": "system", "content": self._summary_content()})
+        prompt.extend(self.messages[self.summarized:])
+        return prompt
+
+    def _summary_content(self):
+        return f"Summary of the earlier conversation:\n{self.summary}"
+
+    def _compact(self, upto):
+        # Turns between the summary and `upto` no longer fit: fold them into the summary
+        if upto <= self.summarized or (self._summary_task and not self._summary_task.done()):
+            return
+        dropped = self.messages[self.summarized:upto]
+        if self.summarizer is None:
+            self.summary = extractive_summary(self.summary, dropped, self.summary_budget)
+            self.summarized = upto
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.summary = extractive_summary(self.summary, dropped, self.summary_budget)
+            self.summarized = upto
+            return
+        self._summary_task = loop.create_task(self._summarize(dropped, upto))
+
+    async def _summarize(self, dropped, upto):
+        try:
+            summary = await self.summarizer(self.summary, dropped)
+        except Exception as err:
+            print(f"Summarizing conversation failed, keeping an extractive summary: {err}")
+            summary = extractive_summary(self.summary, dropped, self.summary_budget)
+        if upto <= len(self.messages):
+            self.summary = summary
+            self.summarized = upto
+
+    def close(self):
+        if self._summary_task is not None:
+            self._summary_task.cancel()
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-in for the OpenAI chat completions API, so server.py can be load-tested
+# without a key or a bill. Point the server at it with OPENAI_BASE_URL=http://host:port/v1
+FIRST_TOKEN_MS = float(os.getenv('FAKE_OPENAI_FIRST_TOKEN_MS', 300))
+TOKENS_PER_SECOND = float(os.getenv('FAKE_OPENAI_TOKENS_PER_SECOND', 60))
+RESPONSE_TOKENS = int(os.getenv('FAKE_OPENAI_RESPONSE_TOKENS', 25))
+# Random spread around the first-token latency, as a fraction of it
+JITTER = float(os.getenv('FAKE_OPENAI_JITTER', 0.3))
+# Fraction of requests that stall for SLOW_FACTOR times longer before the first token (the tail hedging targets)
+SLOW_RATE = float(os.getenv('FAKE_OPENAI_SLOW_RATE', 0))
+SLOW_FACTOR = float(os.getenv('FAKE_OPENAI_SLOW_FACTOR', 10))
+
+WORDS = ("sure", "which", "pizza", "would", "you", "like", "today", "we", "have", "barbecue", "garlic",
+         "and", "tikka", "chicken", "with", "olives", "or", "mushrooms", "great", "choice")
+
+app = FastAPI()
+stats = {"requests": 0, "streams_completed": 0, "streams_cancelled": 0, "tokens": 0}
+
+
+def chunk(completion_id, model, content=None, finish_reason=None):
+    delta = {} if content is None else {"role": "assistant", "content": content}
+    return "data: " + json.dumps({
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+
+def fake_tokens():
+    tokens = [(" " if index else "") + random.choice(WORDS) for index in range(RESPONSE_TOKENS)]
+    tokens[-1] += "."
+    return tokens
+
+
+def first_token_delay():
+    delay = FIRST_TOKEN_MS / 1000 * random.uniform(1 - JITTER, 1 + JITTER)
+    return delay * SLOW_FACTOR if random.random() < SLOW_RATE else delay
+
+
+async def stream_tokens(completion_id, model):
+    completed = False
+    try:
+        await asyncio.sleep(first_token_delay())
+        for index, token in enumerate(fake_tokens()):
+            if index:
+                await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            stats["tokens"] += 1
+            yield chunk(completion_id, model, token)
+        yield chunk(completion_id, model, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+        completed = True
+    finally:
+        stats["streams_completed" if completed else "streams_cancelled"] += 1
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    completion_id = f"chatcmpl-fake{stats['requests']}"
+    model = body.get("model", "gpt-3.5-turbo")
+    if body.get("stream"):
+        return StreamingResponse(stream_tokens(completion_id, model), media_type="text/event-stream")
+
+    await asyncio.sleep(first_token_delay() + (RESPONSE_TOKENS - 1) / TOKENS_PER_SECOND)
+    stats["tokens"] += RESPONSE_TOKENS
+    content = "".join(fake_tokens())
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": RESPONSE_TOKENS, "total_tokens": RESPONSE_TOKENS},
+    })
+
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "gpt-3.5-turbo-1106", "object": "model", "created": 0, "owned_by": "fake"}]}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible streaming stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,86 @@
+import itertools
+import random
+import threading
+import requests
+from twilio.base.exceptions import TwilioRestException
+
+# What the stand-in's callees "do", with rough real-world proportions
+ANSWERED_BY = (("human", 0.6), ("machine_start", 0.3), ("unknown", 0.1))
+
+
+class FakeCall:
+    def __init__(self, sid, to, from_):
+        self.sid = sid
+        self.to = to
+        self.from_ = from_
+        self.status = "queued"
+
+
+class FakeTwilioClient:
+    """
+    Local stand-in for the parts of TwilioClient the campaign dialer uses.
+
+    Calls "ring" and finish on background timers. Their status and
+    answering-machine callbacks either go straight into a CampaignStore
+    (`store`) or are POSTed to a running server.py (`webhook_base_url`), like
+    Twilio would. `failure_rate` of the calls fail with a throttling error
+    to exercise retries.
+    """
+
+    def __init__(self, store=None, webhook_base_url=None, agent_id="agent", failure_rate=0.1,
+                 ring_seconds=0.5, talk_seconds=2.0, seed=None):
+        self.store = store
+        self.webhook_base_url = webhook_base_url
+        self.agent_id = agent_id
+        self.failure_rate = failure_rate
+        self.ring_seconds = ring_seconds
+        self.talk_seconds = talk_seconds
+        self.random = random.Random(seed)
+        self.calls = {}
+        self._sids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def place_phone_call(self, from_number, to_number, agent_id):
+        if self.random.random() < self.failure_rate:
+            raise TwilioRestException(429, "/Calls.json", "Too Many Requests", code=20429)
+        with self._lock:
+            call = FakeCall(f"CA{next(self._sids):032d}", to_number, from_number)
+            self.calls[call.sid] = call
+        answered_by = self.random.choices([a for a, _ in ANSWERED_BY], [w for _, w in ANSWERED_BY])[0]
+        self._later(self.ring_seconds, self._answer, call, answered_by)
+        return call
+
+    def fetch_call_status(self, sid):
+        call = self.calls.get(sid)
+        # A call from an earlier run: its timers died with that process, so report it finished
+        return call.status if call is not None else "completed"
+
+    def _later(self, delay, function, *args):
+        timer = threading.Timer(delay, function, args)
+        timer.daemon = True
+        timer.start()
+
+    def _answer(self, call, answered_by):
+        self._status(call, "in-progress")
+        self._amd(call, answered_by)
+        # Machines get hung up on by the webhook, people talk to the agent for a while
+        self._later(0.1 if answered_by == "machine_start" else self.talk_seconds, self._status, call, "completed")
+
+    def _status(self, call, status):
+        call.status = status
+        if self.store is not None:
+            self.store.record_status(call.sid, status)
+        if self.webhook_base_url:
+            self._post("/twilio-status-callback", {"CallSid": call.sid, "CallStatus": status})
+
+    def _amd(self, call, answered_by):
+        if self.store is not None:
+            self.store.record_amd(call.sid, answered_by)
+        if self.webhook_base_url:
+            self._post(f"/twilio-voice-webhook/{self.agent_id}", {"CallSid": call.sid, "AnsweredBy": answered_by})
+
+    def _post(self, path, data):
+        try:
+            requests.post(f"{self.webhook_base_url}{path}", data=data, timeout=5)
+        except requests.RequestException as err:
+            print(f"Fake Twilio callback to {path} failed: {err}")
@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import json
+import os
+import time
+
+BOUNDARIES = {
+    "sentence": (".", "!", "?"),
+    "phrase": (".", "!", "?", ",", ";", ":"),
+    "none": (),
+}
+
+
+class CoalescingConfig:
+    """
+    How streamed deltas are merged into websocket frames. A frame is flushed at a
+    phrase/sentence boundary, once `max_chars` are buffered, or `max_delay`
+    seconds after its first delta, whichever comes first. At most
+    `max_queued_frames` frames wait for a slow socket before the LLM stream is paused.
+    """
+
+    def __init__(self, flush_on="phrase", max_chars=120, max_delay=0.1, max_queued_frames=32):
+        if flush_on not in BOUNDARIES:
+            raise ValueError(f"flush_on must be one of {', '.join(BOUNDARIES)}")
+        self.flush_on = flush_on
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.max_queued_frames = max_queued_frames
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            flush_on=os.getenv('FRAME_FLUSH_ON', "phrase"),
+            max_chars=int(os.getenv('FRAME_MAX_CHARS', 120)),
+            max_delay=float(os.getenv('FRAME_MAX_DELAY_MS', 100)) / 1000,
+            max_queued_frames=int(os.getenv('FRAME_MAX_QUEUE', 32)),
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def get_coalescing_config():
+    # Built on first use, after server.py has loaded .env
+    return CoalescingConfig.from_env()
+
+
+_END = object()
+
+
+class FrameCoalescer:
+    """
+    Sends one response's events over a websocket, merged into fewer, larger frames.
+
+    A reader task pulls events from the LLM and fills a bounded queue (flushing
+    partial text on a timer once it is `max_delay` old); this side drains it
+    into the socket. When the socket stalls the queue fills up and the
+    reader stops pulling from the LLM, so memory per call stays bounded.
+    """
+
+    def __init__(self, send_text, config, metrics=None):
+        self.send_text = send_text
+        self.config = config
+        self.metrics = metrics
+        self.boundaries = BOUNDARIES[config.flush_on]
+        self._parts = []
+        self._chars = 0
+        self._events = 0
+        self._template = None
+        self._queue = None
+        self._flush_timer = None
+
+    async def stream(self, events, received_at=None):
+        queue = asyncio.Queue(maxsize=self.config.max_queued_frames)
+        self._queue = queue
+        reader = asyncio.create_task(self._read(events, queue))
+        first_frame = True
+        try:
+            while True:
+                frame = await queue.get()
+                if frame is _END:
+                    break
+                await self._send(frame)
+                if first_frame and received_at is not None and self.metrics:
+                    self.metrics.observe("first_frame", time.perf_counter() - received_at)
+                first_frame = False
+            # Re-raises whatever stopped the upstream events
+            await reader
+        finally:
+            reader.cancel()
+            self._cancel_flush()
+
+    async def _read(self, events, queue):
+        cancelled = False
+        try:
+            async for event in events:
+                if self._template is None:
+                    self._template = event
+                self._parts.append(event['content'])
+                self._chars += len(event['content'])
+                self._events += 1
+                if self._flush_timer is None:
+                    # The reader owns the deadline, so it fires even while the sender waits on the queue
+                    self._flush_timer = asyncio.get_running_loop().call_later(self.config.max_delay, self._flush_due)
+
+                final = event['content_complete'] or event['end_call']
+                if final:
+                    self._template = event
+                if final or self._chars >= self.config.max_chars or (
+                    self.boundaries and event['content'].rstrip().endswith(self.boundaries)
+                ):
+                    frame = self._take_frame()
+                    if queue.full() and self.metrics:
+                        self.metrics.inc("backpressure")
+                    await queue.put(frame)
+                if final:
+                    break
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # Even when the upstream fails, what was buffered still goes out and the sender is released
+            if not cancelled:
+                if self._parts:
+                    await queue.put(self._take_frame())
+                await queue.put(_END)
+
+    def _flush_due(self):
+        self._flush_timer = None
+        if not self._parts:
+            return
+        if self._queue.full():
+            # The socket is behind anyway; try again rather than block the event loop
+            self._flush_timer = asyncio.get_running_loop().call_later(self.config.max_delay, self._flush_due)
+            return
+        self._queue.put_nowait(self._take_frame())
+
+    def _cancel_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _take_frame(self):
+        if not self._parts:
+            return None
+        self._cancel_flush()
+        frame = dict(self._template, content="".join(self._parts))
+        if self.metrics:
+            self.metrics.inc("events", self._events)
+        self._parts = []
+        self._chars = 0
+        self._events = 0
+        self._template = None
+        return frame
+
+    async def _send(self, frame):
+        text = json.dumps(frame)
+        send_started = time.perf_counter()
+        await self.send_text(text)
+        if self.metrics:
+            self.metrics.observe("send", time.perf_counter() - send_started)
+            self.metrics.observe("frame_bytes", len(text))
+            self.metrics.inc("frames")
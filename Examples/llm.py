@@ -1,14 +1,35 @@
-from openai import OpenAI
 import os
+import time
+from clients import get_async_openai_client, get_openai_client
+from context_window import ConversationContext
+from frame_coalescer import get_coalescing_config
+from model_strategy import get_request_strategy
+from response_cache import cache_key, get_response_cache, split_into_chunks
 
 beginSentence = "Hey there, this is Pizza AI, how can I help you ?"
 agentPrompt = "Task: As the receptionist of a pizzeria called Pizza AI, your job is to take in orders from clients. You serve only chicken pizzas, and there are 3 types of pizzas: barbecue chicken pizza, garlic chicken pizza, and chicken tikka pizza. The possible optional toppings are olives, mushrooms, caramelized onions, and eggplants. \n\nConversational Style: Communicate concisely and conversationally. Aim for responses in short, clear prose, ideally under 10 words.\n\nPersonality: A happy and joyful receptionist who is happy to help people order pizzas."
+systemPrompt = '##Objective\nYou are a voice AI agent engaging in a human-like voice conversation with the user. You will respond based on your given instruction and the provided transcript and be as human-like as possible\n\n## Style Guardrails\n- [Be concise] Keep your response succinct, short, and get to the point quickly. Address one question or action item at a time. Don\'t pack everything you want to say into one utterance.\n- [Do not repeat] Don\'t repeat what\'s in the transcript. Rephrase if you have to reiterate a point. Use varied sentence structures and vocabulary to ensure each response is unique and personalized.\n- [Be conversational] Speak like a human as though you\'re speaking to a close friend -- use everyday language and keep it human-like. Occasionally add filler words, while keeping the prose short. Avoid using big words or sounding too formal.\n- [Reply with emotions]: You have human-like emotions, attitudes, and dispositions. When appropriate: use tone and style to create more engaging and personalized responses; incorporate humor or wit; get emotional or empathetic; apply elements of surprise or suspense to keep the user engaged. Don\'t be a pushover.\n- [Be proactive] Lead the conversation and do not be passive. Most times, engage users by ending with a question or suggested next step.\n\n## Response Guideline\n- [Overcome ASR errors] This is a real-time transcript, expect there to be errors. If you can guess what the user is trying to say,  then guess and respond. When you must ask for clarification, pretend that you heard the voice and be colloquial (use phrases like "didn\'t catch that", "some noise", "pardon", "you\'re coming through choppy", "static in your speech", "voice is cutting in and out"). Do not ever mention "transcription error", and don\'t repeat yourself.\n- [Always stick to your role] Think about what your role can and cannot do. If your role cannot do something, try to steer the conversation back to the goal of the conversation and to your role. Don\'t repeat yourself in doing this. You should still be creative, human-like, and lively.\n- [Create smooth conversation] Your response should both fit your role and fit into the live calling session to create a human-like conversation. You respond directly to what the user just said.\n\n## Role\n' + agentPrompt
 
 class LlmClient:
-    def __init__(self):
-        self.client = OpenAI(
-            organization=os.environ['OPENAI_ORGANIZATION_ID'],
-            api_key=os.environ['OPENAI_API_KEY'],
+    """
+    Per-call session: the conversation state for one call. The OpenAI clients
+    (and their connections) are borrowed from the process-wide pool in clients.py.
+    """
+    def __init__(self, metrics=None):
+        # Optional metrics.CallMetrics to report OpenAI latency into
+        self.metrics = metrics
+        # Process-wide settings, read from the environment when the first call arrives:
+        # how streamed deltas are merged into websocket frames, which model answers each
+        # turn (and the backup request when it is slow to start), and the shared answer cache
+        self.coalescing = get_coalescing_config()
+        self.strategy = get_request_strategy()
+        self.response_cache = get_response_cache()
+        self.client = get_openai_client()
+        self.async_client = get_async_openai_client()
+        # Per-call prompt state, so each turn only converts what is new in the transcript
+        self.context = ConversationContext(
+            systemPrompt,
+            summarizer=self.summarize_async if os.getenv('LLM_CONTEXT_SUMMARIZER') else None,
         )
     
     def draft_begin_messsage(self):
@@ -35,14 +56,10 @@ class LlmClient:
         return messages
 
     def prepare_prompt(self, request):
-        prompt = [{
-            "role": "system",
-            "content": '##Objective\nYou are a voice AI agent engaging in a human-like voice conversation with the user. You will respond based on your given instruction and the provided transcript and be as human-like as possible\n\n## Style Guardrails\n- [Be concise] Keep your response succinct, short, and get to the point quickly. Address one question or action item at a time. Don\'t pack everything you want to say into one utterance.\n- [Do not repeat] Don\'t repeat what\'s in the transcript. Rephrase if you have to reiterate a point. Use varied sentence structures and vocabulary to ensure each response is unique and personalized.\n- [Be conversational] Speak like a human as though you\'re speaking to a close friend -- use everyday language and keep it human-like. Occasionally add filler words, while keeping the prose short. Avoid using big words or sounding too formal.\n- [Reply with emotions]: You have human-like emotions, attitudes, and dispositions. When appropriate: use tone and style to create more engaging and personalized responses; incorporate humor or wit; get emotional or empathetic; apply elements of surprise or suspense to keep the user engaged. Don\'t be a pushover.\n- [Be proactive] Lead the conversation and do not be passive. Most times, engage users by ending with a question or suggested next step.\n\n## Response Guideline\n- [Overcome ASR errors] This is a real-time transcript, expect there to be errors. If you can guess what the user is trying to say,  then guess and respond. When you must ask for clarification, pretend that you heard the voice and be colloquial (use phrases like "didn\'t catch that", "some noise", "pardon", "you\'re coming through choppy", "static in your speech", "voice is cutting in and out"). Do not ever mention "transcription error", and don\'t repeat yourself.\n- [Always stick to your role] Think about what your role can and cannot do. If your role cannot do something, try to steer the conversation back to the goal of the conversation and to your role. Don\'t repeat yourself in doing this. You should still be creative, human-like, and lively.\n- [Create smooth conversation] Your response should both fit your role and fit into the live calling session to create a human-like conversation. You respond directly to what the user just said.\n\n## Role\n' +
-          agentPrompt
-        }]
-        transcript_messages = self.convert_transcript_to_openai_messages(request['transcript'])
-        for message in transcript_messages:
-            prompt.append(message)
+        # Only the utterances added since the last turn are converted, and the
+        # prompt is trimmed to the context's token budget
+        self.context.update(request['transcript'])
+        prompt = self.context.build()
 
         if request['interaction_type'] == "reminder_required":
             prompt.append({
@@ -51,22 +68,76 @@ class LlmClient:
             })
         return prompt
 
+    # Background compaction of turns that no longer fit in the context budget
+    async def summarize_async(self, previous_summary, messages):
+        transcript = "\n".join(
+            f"{'Agent' if message['role'] == 'assistant' else 'User'}: {message['content']}"
+            for message in messages
+        )
+        response = await self.async_client.chat.completions.create(
+            model=os.getenv('LLM_CONTEXT_SUMMARIZER'),
+            messages=[{
+                "role": "user",
+                "content": "Summarize this phone conversation in a few short sentences. Keep every order detail "
+                           f"(pizzas, toppings, names, addresses).\n\nEarlier summary:\n{previous_summary or '(none)'}"
+                           f"\n\nNew turns:\n{transcript}",
+            }],
+        )
+        return response.choices[0].message.content
+
+    def response_cache_key(self, request):
+        if not self.response_cache.enabled or request['interaction_type'] != "response_required":
+            return None
+        return cache_key(request['transcript'])
+
+    # Common turns (the menu, the pizza types, the toppings) are answered from the
+    # process-wide cache, streamed back in the same chunks as a live completion
+    def cached_response_events(self, request, key):
+        content = self.response_cache.get(key) if key else None
+        if content is None:
+            return None
+        if self.metrics:
+            self.metrics.inc("cache_hits")
+        events = [{
+            "response_id": request['response_id'],
+            "content": chunk,
+            "content_complete": False,
+            "end_call": False,
+        } for chunk in split_into_chunks(content)]
+        events.append({
+            "response_id": request['response_id'],
+            "content": "",
+            "content_complete": True,
+            "end_call": False,
+        })
+        return events
+
     def draft_response(self, request):      
+        key = self.response_cache_key(request)
+        cached_events = self.cached_response_events(request, key)
+        if cached_events:
+            yield from cached_events
+            return
+
         prompt = self.prepare_prompt(request)
         stream = self.client.chat.completions.create(
-            model="gpt-3.5-turbo-1106",
+            model=self.strategy.choose_model(request),
             messages=prompt,
             stream=True,
         )
 
+        parts = []
         for chunk in stream:
             if chunk.choices[0].delta.content is not None:
+                parts.append(chunk.choices[0].delta.content)
                 yield {
                     "response_id": request['response_id'],
                     "content": chunk.choices[0].delta.content,
                     "content_complete": False,
                     "end_call": False,
                 }
+        if key and parts:
+            self.response_cache.set(key, "".join(parts))
         
         yield {
             "response_id": request['response_id'],
@@ -74,3 +145,51 @@ class LlmClient:
             "content_complete": True,
             "end_call": False,
         }
+
+    # Same events as draft_response, but never blocks the event loop while waiting on OpenAI.
+    # Cancelling the task that iterates this generator closes the upstream stream right away.
+    async def draft_response_async(self, request):
+        key = self.response_cache_key(request)
+        cached_events = self.cached_response_events(request, key)
+        if cached_events:
+            for event in cached_events:
+                yield event
+            return
+
+        prompt = self.prepare_prompt(request)
+        started = time.perf_counter()
+        first_token_at = None
+        parts = []
+        # Routed to the fast model or hedged, as configured
+        contents = self.strategy.stream(self.async_client, request, prompt, self.metrics)
+        try:
+            async for content in contents:
+                # Each streamed delta is (close enough to) one token
+                parts.append(content)
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    if self.metrics:
+                        self.metrics.observe("ttft", first_token_at - started)
+                yield {
+                    "response_id": request['response_id'],
+                    "content": content,
+                    "content_complete": False,
+                    "end_call": False,
+                }
+        finally:
+            # Closes the upstream stream right away, not whenever the generator is collected
+            await contents.aclose()
+
+        elapsed = time.perf_counter() - first_token_at if first_token_at else 0
+        if self.metrics and len(parts) > 1 and elapsed > 0:
+            self.metrics.observe("tokens_per_second", len(parts) / elapsed)
+        # Only complete responses are cached: a cancelled stream never gets here
+        if key and parts:
+            self.response_cache.set(key, "".join(parts))
+
+        yield {
+            "response_id": request['response_id'],
+            "content": "",
+            "content_complete": True,
+            "end_call": False,
+        }
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import httpx
+import websockets
+
+# What simulated callers say, in order; interruptions are drawn from INTERRUPTIONS
+USER_TURNS = (
+    "hi I would like to order a pizza please",
+    "can I get a large barbecue chicken pizza",
+    "could you add olives and caramelized onions on top",
+    "actually make that two of them",
+    "and one garlic chicken pizza with mushrooms",
+    "how long will the delivery take to my place",
+    "my address is twelve main street apartment four",
+    "that is all thank you very much",
+)
+INTERRUPTIONS = ("wait sorry", "hold on a second", "no no that is not what I meant", "sorry can you repeat that")
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class LoadStats:
+    def __init__(self):
+        self.first_frame = []
+        self.latency = []
+        self.responses = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.stale_frames = 0
+        self.errors = 0
+
+
+def process_usage(pid):
+    """
+    (cpu seconds, rss bytes) of a local process, read from /proc; None where that is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks, rss_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class SimulatedCall:
+    """
+    One Retell client on /llm-websocket/{call_id}: the user's words arrive as
+    live transcript updates, then Retell asks for a response (sometimes a
+    reminder), and now and then the user barges in mid-response, which bumps
+    response_id and abandons the response in flight.
+    """
+
+    def __init__(self, url, stats, turns, word_interval, think_time, interrupt_rate, reminder_rate, timeout):
+        self.url = url
+        self.stats = stats
+        self.turns = turns
+        self.word_interval = word_interval
+        self.think_time = think_time
+        self.interrupt_rate = interrupt_rate
+        self.reminder_rate = reminder_rate
+        self.timeout = timeout
+        self.transcript = []
+        self.response_id = 0
+        self.sent_at = None
+
+    async def run(self):
+        async with websockets.connect(self.url, max_size=None) as ws:
+            begin = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+            self.transcript.append({"role": "agent", "content": begin['content']})
+            for turn in range(self.turns):
+                utterance = USER_TURNS[turn % len(USER_TURNS)]
+                await self.speak(ws, utterance)
+                interaction_type = "reminder_required" if random.random() < self.reminder_rate else "response_required"
+                await self.request_response(ws, interaction_type)
+                while True:
+                    # Sometimes the user talks over the agent's answer
+                    interrupt_after = random.uniform(0, 1.0) if random.random() < self.interrupt_rate else None
+                    content, completed = await self.receive_response(ws, interrupt_after)
+                    self.transcript.append({"role": "agent", "content": content})
+                    if completed:
+                        break
+                    self.stats.abandoned += 1
+                    await self.speak(ws, random.choice(INTERRUPTIONS))
+                    await self.request_response(ws, "response_required")
+                await asyncio.sleep(self.think_time * random.uniform(0.5, 1.5))
+
+    async def speak(self, ws, utterance):
+        words = utterance.split()
+        for count in range(1, len(words) + 1):
+            partial = self.transcript + [{"role": "user", "content": " ".join(words[:count])}]
+            await ws.send(json.dumps({"interaction_type": "update_only", "transcript": partial}))
+            await asyncio.sleep(self.word_interval * random.uniform(0.5, 1.5))
+        self.transcript.append({"role": "user", "content": utterance})
+
+    async def request_response(self, ws, interaction_type):
+        self.response_id += 1
+        self.stats.responses += 1
+        self.sent_at = time.perf_counter()
+        await ws.send(json.dumps({
+            "interaction_type": interaction_type,
+            "response_id": self.response_id,
+            "transcript": self.transcript,
+        }))
+
+    async def receive_response(self, ws, interrupt_after=None):
+        """
+        (content, completed): completed is False when the user interrupted it.
+        """
+        parts = []
+        first_frame_at = None
+        while True:
+            event = json.loads(await asyncio.wait_for(ws.recv(), self.timeout))
+            now = time.perf_counter()
+            if event.get('response_id') != self.response_id:
+                # Frames of an abandoned response that were already on the wire
+                self.stats.stale_frames += 1
+                continue
+            if first_frame_at is None:
+                first_frame_at = now
+                self.stats.first_frame.append(now - self.sent_at)
+            parts.append(event['content'])
+            if event['content_complete'] or event['end_call']:
+                self.stats.latency.append(now - self.sent_at)
+                self.stats.completed += 1
+                return "".join(parts), True
+            if interrupt_after is not None and now - first_frame_at >= interrupt_after:
+                return "".join(parts), False
+
+
+async def run_load(url_template, args, server_pid=None):
+    stats = LoadStats()
+    usage_before = process_usage(server_pid) if server_pid else None
+    peak_rss = usage_before[1] if usage_before else 0
+    done = asyncio.Event()
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while not done.is_set():
+            usage = process_usage(server_pid)
+            if usage:
+                peak_rss = max(peak_rss, usage[1])
+            await asyncio.sleep(0.25)
+
+    async def one_call(index):
+        await asyncio.sleep(args.ramp_up * index / max(args.calls, 1))
+        call = SimulatedCall(
+            url_template.format(call_id=f"load-{index}-{random.getrandbits(32):08x}"), stats, args.turns,
+            args.word_interval, args.think_time, args.interrupt_rate, args.reminder_rate, args.timeout,
+        )
+        try:
+            await call.run()
+        except Exception as err:
+            stats.errors += 1
+            print(f"Call {index} failed: {err!r}")
+
+    sampler = asyncio.create_task(sample_memory()) if usage_before else None
+    started = time.perf_counter()
+    await asyncio.gather(*(one_call(index) for index in range(args.calls)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    if sampler:
+        await sampler
+
+    report = {
+        "calls": args.calls,
+        "errors": stats.errors,
+        "elapsed_s": round(elapsed, 2),
+        "responses": stats.responses,
+        "completed": stats.completed,
+        "abandoned": stats.abandoned,
+        "stale_frames": stats.stale_frames,
+    }
+    for name, values in (("first_frame_ms", stats.first_frame), ("latency_ms", stats.latency)):
+        for q in (50, 95, 99):
+            report[f"{name}_p{q}"] = round(percentile(values, q) * 1000, 1)
+    usage_after = process_usage(server_pid) if server_pid else None
+    if usage_before and usage_after:
+        report["server_cpu_percent"] = round((usage_after[0] - usage_before[0]) / elapsed * 100, 1)
+        report["server_rss_mb"] = round(usage_after[1] / 2 ** 20, 1)
+        report["server_rss_per_call_kb"] = round((peak_rss - usage_before[1]) / max(args.calls, 1) / 1024, 1)
+    return report
+
+
+def model_strategy_report(base_url):
+    """
+    Routing and hedging figures from the server's /metrics (process-wide totals since it started).
+    """
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=5).text
+    except httpx.HTTPError as err:
+        print(f"Could not read {base_url}/metrics: {err}")
+        return {}
+    totals = {}
+    for line in text.splitlines():
+        if not line.startswith("#") and "{" not in line and " " in line:
+            name, value = line.rsplit(" ", 1)
+            totals[name] = float(value)
+    responses = totals.get("llm_responses_total", 0)
+    hedges = totals.get("llm_hedged_requests_total", 0)
+    return {
+        "fast_routes": int(totals.get("llm_fast_model_routes_total", 0)),
+        "hedge_rate": round(hedges / responses, 3) if responses else 0.0,
+        "hedge_win_rate": round(totals.get("llm_hedge_wins_total", 0) / hedges, 3) if hedges else 0.0,
+        "hedge_extra_prompt_tokens": int(totals.get("llm_hedge_extra_prompt_tokens_total", 0)),
+    }
+
+
+def start_process(command, env, port, cwd):
+    process = subprocess.Popen(command, env=env, cwd=cwd)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{' '.join(command)} did not start listening on port {port}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent Retell calls against server.py.")
+    parser.add_argument("--calls", type=int, default=20, help="Concurrent simulated calls")
+    parser.add_argument("--turns", type=int, default=6, help="User turns per call")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Seconds over which calls are started")
+    parser.add_argument("--word-interval", type=float, default=0.15, help="Seconds between live transcript words")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Pause after each answer")
+    parser.add_argument("--interrupt-rate", type=float, default=0.15, help="Chance the user barges into an answer")
+    parser.add_argument("--reminder-rate", type=float, default=0.05, help="Chance a turn is reminder_required")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--server-url", help="ws://host:port of a running server; otherwise one is started here")
+    parser.add_argument("--server-pid", type=int, help="PID of --server-url's process, for CPU and memory figures")
+    parser.add_argument("--server-port", type=int, default=8080)
+    parser.add_argument("--openai-port", type=int, default=8001)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="Stand-in's time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Stand-in's streaming throughput")
+    parser.add_argument("--response-tokens", type=int, default=25)
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of stand-in requests that stall")
+    args = parser.parse_args(argv)
+
+    processes = []
+    server_pid = args.server_pid
+    server_url = args.server_url
+    try:
+        if server_url is None:
+            here = os.path.dirname(os.path.abspath(__file__))
+            env = dict(
+                os.environ,
+                FAKE_OPENAI_FIRST_TOKEN_MS=str(args.first_token_ms),
+                FAKE_OPENAI_TOKENS_PER_SECOND=str(args.tokens_per_second),
+                FAKE_OPENAI_RESPONSE_TOKENS=str(args.response_tokens),
+                FAKE_OPENAI_SLOW_RATE=str(args.slow_rate),
+            )
+            processes.append(start_process(
+                [sys.executable, "fake_openai.py", "--port", str(args.openai_port)], env, args.openai_port, here,
+            ))
+            # server.py loads .env with override=True, so keep TWILIO_PHONE_NUMBER and OPENAI_BASE_URL out of it
+            env.update(OPENAI_BASE_URL=f"http://127.0.0.1:{args.openai_port}/v1")
+            env.pop('TWILIO_PHONE_NUMBER', None)
+            env.pop('CAMPAIGN_DB', None)
+            for key in ('OPENAI_API_KEY', 'OPENAI_ORGANIZATION_ID', 'RETELL_API_KEY', 'TWILIO_ACCOUNT_ID',
+                        'TWILIO_AUTH_TOKEN'):
+                env.setdefault(key, "load-test")
+            server = start_process(
+                [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.server_port), "--log-level", "warning"],
+                env, args.server_port, here,
+            )
+            processes.append(server)
+            server_pid = server.pid
+            server_url = f"ws://127.0.0.1:{args.server_port}"
+
+        report = asyncio.run(run_load(server_url + "/llm-websocket/{call_id}", args, server_pid))
+        report.update(model_strategy_report(server_url.replace("ws", "http", 1)))
+        print(json.dumps(report, indent=4))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
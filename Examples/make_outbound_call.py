@@ -1,63 +1,134 @@
-import socket
-import json
-import time
+import asyncio
+import itertools
+import random
+from udp_protocol import DEFAULT_CHUNK_SIZE, Reassembler, encode_datagrams
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._datagram_received(data, addr)
+
+    def error_received(self, exc):
+        print(f"UDP error: {exc}")
+
 
 class RetellAIUDPClient:
-    def __init__(self, host, port):
+    """
+    Asyncio UDP client that multiplexes any number of conversations over one socket.
+
+    Each request carries an id that the server echoes back, so concurrent
+    requests are matched to their own replies. Requests are retransmitted with
+    exponential backoff until `timeout` runs out, and messages larger than one
+    datagram are chunked and reassembled on both sides (see udp_protocol.py).
+    """
+
+    def __init__(self, host, port, timeout=5.0, initial_retransmit=0.25, chunk_size=DEFAULT_CHUNK_SIZE):
         self.host = host
         self.port = port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.conversation_id = None
+        self.timeout = timeout
+        self.initial_retransmit = initial_retransmit
+        self.chunk_size = chunk_size
+        self.transport = None
+        self.pending = {}
+        self.reassembler = Reassembler()
+        self.retransmits = 0
+        self._ids = itertools.count(random.getrandbits(48))
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _ClientProtocol(self), remote_addr=(self.host, self.port)
+        )
+        return self
+
+    def _datagram_received(self, data, addr):
+        try:
+            complete = self.reassembler.feed(addr, data)
+        except ValueError as err:
+            print(f"Dropping malformed reply: {err}")
+            return
+        if complete is None:
+            return
+        request_id, message = complete
+        future = self.pending.get(request_id)
+        if future is not None and not future.done():
+            future.set_result(message)
 
-    def start_conversation(self, initial_context):
-        message = {
+    async def request(self, message, timeout=None):
+        """
+        Send one message and wait for the reply to it, retransmitting as needed.
+        """
+        if self.transport is None:
+            await self.connect()
+        loop = asyncio.get_running_loop()
+        request_id = next(self._ids)
+        datagrams = encode_datagrams(request_id, message, self.chunk_size)
+        future = loop.create_future()
+        self.pending[request_id] = future
+        deadline = loop.time() + (timeout or self.timeout)
+        interval = self.initial_retransmit
+        try:
+            while True:
+                for datagram in datagrams:
+                    self.transport.sendto(datagram)
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"No reply to request {request_id} from {self.host}:{self.port}")
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), min(interval, remaining))
+                except asyncio.TimeoutError:
+                    self.retransmits += 1
+                    interval *= 2
+        finally:
+            del self.pending[request_id]
+
+    async def start_conversation(self, initial_context):
+        response = await self.request({
             "type": "start",
             "payload": {
                 "context": initial_context
             }
-        }
-        self._send_message(message)
-        response = self._receive_message()
-        self.conversation_id = response.get("conversation_id")
+        })
         return response
 
-    def send_message(self, text):
-        if not self.conversation_id:
+    async def send_message(self, conversation_id, text):
+        if not conversation_id:
             raise ValueError("Conversation not started. Call start_conversation first.")
-        
-        message = {
+        return await self.request({
             "type": "message",
             "payload": {
-                "conversation_id": self.conversation_id,
+                "conversation_id": conversation_id,
                 "text": text
             }
-        }
-        self._send_message(message)
-        return self._receive_message()
+        })
 
-    def _send_message(self, message):
-        self.sock.sendto(json.dumps(message).encode(), (self.host, self.port))
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.cancel()
 
-    def _receive_message(self):
-        data, _ = self.sock.recvfrom(4096)
-        return json.loads(data.decode())
 
-    def close(self):
-        self.sock.close()
+async def main():
+    client = await RetellAIUDPClient("api.retell.ai", 12345).connect()  # Replace with actual host and port
 
-# Example usage
-if __name__ == "__main__":
-    client = RetellAIUDPClient("api.retell.ai", 12345)  # Replace with actual host and port
-    
     # Start conversation
     initial_context = "This conversation is about a picture of a sunset over the ocean."
-    response = client.start_conversation(initial_context)
+    response = await client.start_conversation(initial_context)
     print("Conversation started:", response)
 
     # Send a message
     user_message = "What can you tell me about the sunset in the picture?"
-    response = client.send_message(user_message)
+    response = await client.send_message(response.get("conversation_id"), user_message)
     print("AI response:", response)
 
     # Close the connection
-    client.close()
\ No newline at end of file
+    client.close()
+
+# Example usage
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,168 @@
+import bisect
+import os
+import threading
+import time
+
+# Latency buckets in seconds, tuned for voice: most of what matters sits between 50ms and 2s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+SIZE_BUCKETS = (64, 96, 128, 192, 256, 384, 512, 1024, 2048)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense, cheap enough to observe
+    from the hot path (one bisect and three increments).
+    """
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, labels="", name=None):
+        name = name or self.name
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, labels="", name=None):
+        suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+        return [f"{name or self.name}{suffix} {self.value}"]
+
+
+def voice_metrics():
+    return {
+        "ttft": Histogram("llm_openai_time_to_first_token_seconds", "OpenAI request to first streamed token"),
+        "tokens_per_second": Histogram("llm_openai_tokens_per_second", "Streamed OpenAI tokens per second", RATE_BUCKETS),
+        "send": Histogram("llm_websocket_send_seconds", "Time spent in one websocket send"),
+        "first_frame": Histogram("llm_response_first_frame_seconds", "response_id received to first frame sent"),
+        "abandoned": Counter("llm_responses_abandoned_total", "Responses cancelled by a newer response_id"),
+        "responses": Counter("llm_responses_total", "Responses started"),
+        "cache_hits": Counter("llm_response_cache_hits_total", "Responses served from the response cache"),
+        "frames": Counter("llm_websocket_frames_total", "Websocket frames sent"),
+        "events": Counter("llm_response_events_total", "LLM events merged into those frames"),
+        "frame_bytes": Histogram("llm_websocket_frame_bytes", "Size of one websocket frame", SIZE_BUCKETS),
+        "backpressure": Counter("llm_websocket_backpressure_total", "Frames that waited on a full send queue"),
+        "fast_routes": Counter("llm_fast_model_routes_total", "Turns routed to the fast model"),
+        "hedges": Counter("llm_hedged_requests_total", "Requests that missed the first-token deadline and were hedged"),
+        "hedge_wins": Counter("llm_hedge_wins_total", "Hedged requests answered by the hedge"),
+        "hedge_extra_tokens": Counter("llm_hedge_extra_prompt_tokens_total", "Estimated prompt tokens spent on hedges"),
+    }
+
+
+class CallMetrics:
+    """
+    Metrics for one call. Every observation also lands in the process-wide aggregate.
+    """
+
+    def __init__(self, registry, call_id):
+        self.registry = registry
+        self.call_id = call_id
+        self.metrics = voice_metrics()
+
+    def observe(self, name, value):
+        self.metrics[name].observe(value)
+        self.registry.aggregate[name].observe(value)
+
+    def inc(self, name, amount=1):
+        self.metrics[name].inc(amount)
+        self.registry.aggregate[name].inc(amount)
+
+    def summary(self):
+        parts = []
+        for name, metric in self.metrics.items():
+            if isinstance(metric, Histogram):
+                mean = metric.sum / metric.count if metric.count else 0
+                parts.append(f"{name}: n={metric.count} mean={mean:.3f}")
+            else:
+                parts.append(f"{name}: {metric.value}")
+        return ", ".join(parts)
+
+    def close(self):
+        self.registry.remove_call(self.call_id)
+
+
+def per_call_name(name):
+    # llm_x -> llm_call_x: a family of its own, so sum() over the aggregate never counts a call twice
+    return "llm_call_" + name[len("llm_"):]
+
+
+class MetricsRegistry:
+    """
+    Process-wide aggregate metrics, plus (with `per_call`, METRICS_PER_CALL=1)
+    per-call metrics for calls still in progress. Per-call series are exposed as
+    separate llm_call_* families labelled by call_id. Every call is a new set of
+    series, so they are off by default and meant for debugging.
+    """
+
+    def __init__(self, per_call=None):
+        self.per_call = per_call if per_call is not None else os.getenv('METRICS_PER_CALL', "0") == "1"
+        self.aggregate = voice_metrics()
+        self.calls = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def call(self, call_id):
+        call_metrics = CallMetrics(self, call_id)
+        with self._lock:
+            self.calls[call_id] = call_metrics
+        return call_metrics
+
+    def remove_call(self, call_id):
+        with self._lock:
+            self.calls.pop(call_id, None)
+
+    def render(self):
+        """
+        Everything in the Prometheus text exposition format.
+        """
+        with self._lock:
+            calls = list(self.calls.values())
+        lines = [
+            "# HELP llm_active_calls Calls with an open LLM websocket",
+            "# TYPE llm_active_calls gauge",
+            f"llm_active_calls {len(calls)}",
+        ]
+        for metric in self.aggregate.values():
+            kind = "histogram" if isinstance(metric, Histogram) else "counter"
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            lines.extend(metric.render())
+        if self.per_call:
+            for name, metric in self.aggregate.items():
+                kind = "histogram" if isinstance(metric, Histogram) else "counter"
+                family = per_call_name(metric.name)
+                lines.append(f"# HELP {family} {metric.help_text}, per live call")
+                lines.append(f"# TYPE {family} {kind}")
+                for call_metrics in calls:
+                    lines.extend(call_metrics.metrics[name].render(f'call_id="{call_metrics.call_id}",', family))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
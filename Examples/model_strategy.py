@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import os
+from clients import get_async_openai_client
+from context_window import count_tokens
+
+DEFAULT_MODEL = "gpt-3.5-turbo-1106"
+
+
+class RequestStrategy:
+    """
+    Which model answers a turn, and what happens when it is slow to start.
+
+    Routing: turns whose last user utterance is at most `fast_max_words` words,
+    and reminder turns, go to `fast_model` when one is configured.
+
+    Hedging: if no token arrives within `hedge_deadline` seconds, the same
+    prompt is also sent to `hedge_model` (on `hedge_client`, e.g. another
+    endpoint). Whichever stream produces a token first is used and the other is
+    cancelled. The hedge's prompt tokens are the extra cost, counted as
+    hedge_extra_tokens alongside hedges and hedge_wins in the call's metrics.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, fast_model=None, fast_max_words=4, hedge_model=None,
+                 hedge_deadline=None, hedge_client=None):
+        self.model = model
+        self.fast_model = fast_model
+        self.fast_max_words = fast_max_words
+        self.hedge_model = hedge_model or model
+        self.hedge_deadline = hedge_deadline
+        self.hedge_client = hedge_client
+
+    @classmethod
+    def from_env(cls):
+        hedge_base_url = os.getenv('LLM_HEDGE_BASE_URL')
+        return cls(
+            model=os.getenv('LLM_MODEL', DEFAULT_MODEL),
+            fast_model=os.getenv('LLM_FAST_MODEL'),
+            fast_max_words=int(os.getenv('LLM_FAST_MAX_WORDS', 4)),
+            hedge_model=os.getenv('LLM_HEDGE_MODEL'),
+            # 0 (the default) turns hedging off
+            hedge_deadline=float(os.getenv('LLM_HEDGE_DEADLINE_MS', 0)) / 1000 or None,
+            hedge_client=get_async_openai_client(hedge_base_url, os.getenv('LLM_HEDGE_API_KEY'))
+            if hedge_base_url else None,
+        )
+
+    def choose_model(self, request):
+        if not self.fast_model:
+            return self.model
+        if request['interaction_type'] == "reminder_required":
+            return self.fast_model
+        last_user = next(
+            (utterance['content'] for utterance in reversed(request['transcript']) if utterance['role'] == "user"),
+            "",
+        )
+        return self.fast_model if len(last_user.split()) <= self.fast_max_words else self.model
+
+    async def _open(self, client, model, prompt):
+        """
+        Start a streamed completion and wait for its first token: (stream, chunks, first content).
+        """
+        stream = await client.chat.completions.create(model=model, messages=prompt, stream=True)
+        # One iterator for the whole stream, so reading resumes where the first token left off
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return stream, chunks, None
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    return stream, chunks, chunk.choices[0].delta.content
+        except BaseException:
+            await stream.response.aclose()
+            raise
+
+    async def _race(self, client, model, prompt, metrics):
+        # The primary comes first, so it wins a tie
+        tasks = [asyncio.create_task(self._open(client, model, prompt))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_deadline)
+            if not done:
+                tasks.append(asyncio.create_task(self._open(self.hedge_client or client, self.hedge_model, prompt)))
+                if metrics:
+                    metrics.inc("hedges")
+                    metrics.inc("hedge_extra_tokens", sum(count_tokens(message['content']) for message in prompt))
+            while True:
+                winner = next((task for task in tasks if task.done() and task.exception() is None), None)
+                pending = [task for task in tasks if not task.done()]
+                if winner is None and pending:
+                    # A failed request just leaves the race to the other one
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if winner is None:
+                    return tasks[0].result()  # everything failed: raise the primary's error
+                if winner is not tasks[0] and metrics:
+                    metrics.inc("hedge_wins")
+                for task in tasks:
+                    if task is not winner and task.done() and task.exception() is None:
+                        await task.result()[0].response.aclose()
+                return winner.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def stream(self, client, request, prompt, metrics=None):
+        """
+        Content deltas for `prompt`, from the routed model or its hedge.
+        """
+        model = self.choose_model(request)
+        if model != self.model and metrics:
+            metrics.inc("fast_routes")
+        stream, chunks, content = await self._race(client, model, prompt, metrics)
+        try:
+            if content is None:
+                return
+            yield content
+            while True:
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Stop paying for tokens nobody will hear
+            await stream.response.aclose()
+
+
+@functools.lru_cache(maxsize=None)
+def get_request_strategy():
+    # Built on first use, after server.py has loaded .env (the hedge client needs the OpenAI keys)
+    return RequestStrategy.from_env()
@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+from call_trace import read_trace
+from context_window import count_tokens
+from llm import LlmClient
+from response_cache import ResponseCache
+
+
+def recorded_turns(records):
+    """
+    Every response request in a trace, with the frames that answered it and
+    how long they took on the wire.
+    """
+    turns = []
+    by_response_id = {}
+    for seconds, direction, text in records:
+        message = json.loads(text)
+        if direction == "in":
+            if 'response_id' not in message:
+                continue  # live transcript updates never reach prepare_prompt
+            turn = {"request": message, "received": seconds, "frames": [], "completed": False}
+            turns.append(turn)
+            by_response_id[message['response_id']] = turn
+        else:
+            turn = by_response_id.get(message.get('response_id'))
+            if turn is None:
+                continue  # the begin message
+            turn["frames"].append((seconds - turn["received"], message['content']))
+            if message['content_complete'] or message['end_call']:
+                turn["completed"] = True
+    return turns
+
+
+class RecordedCompletions:
+    """
+    Stands in for client.chat.completions: answers each turn with the frames
+    the server sent for it, optionally at their recorded pace.
+    """
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.frames = []
+
+    def create(self, model, messages, stream=True, **kwargs):
+        return self._stream(list(self.frames))
+
+    def _stream(self, frames):
+        started = time.perf_counter()
+        for offset, content in frames:
+            if not content:
+                continue
+            if self.realtime:
+                time.sleep(max(0.0, offset - (time.perf_counter() - started)))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def replay_call(path, live=False, realtime=False):
+    header, records = read_trace(path)
+    llm_client = LlmClient()
+    # Each call starts with an empty cache, as it would have in a fresh server, so no
+    # turn is answered from another trace's recording
+    llm_client.response_cache = ResponseCache.from_env()
+    stub = None
+    current = {}
+    if not live:
+        stub = RecordedCompletions(realtime)
+        llm_client.client = SimpleNamespace(chat=SimpleNamespace(completions=stub))
+        response_cache_key = llm_client.response_cache_key
+
+        def recorded_cache_key(request):
+            # An abandoned turn's recording is cut short; it must not be cached as a whole answer
+            return response_cache_key(request) if current["turn"]["completed"] else None
+        llm_client.response_cache_key = recorded_cache_key
+
+    # Time prepare_prompt on its own and measure the prompt it builds
+    turn_stats = {}
+    prepare_prompt = llm_client.prepare_prompt
+
+    def timed_prepare_prompt(request):
+        started = time.perf_counter()
+        prompt = prepare_prompt(request)
+        turn_stats["prepare_ms"] = (time.perf_counter() - started) * 1000
+        turn_stats["prompt_messages"] = len(prompt)
+        turn_stats["prompt_tokens"] = sum(count_tokens(message['content']) for message in prompt)
+        return prompt
+    llm_client.prepare_prompt = timed_prepare_prompt
+
+    results = []
+    for turn in recorded_turns(records):
+        turn_stats = {}
+        current["turn"] = turn
+        if stub is not None:
+            stub.frames = turn["frames"]
+        started = time.perf_counter()
+        first_event_at = None
+        for event in llm_client.draft_response(turn["request"]):
+            if first_event_at is None and event['content']:
+                first_event_at = time.perf_counter()
+        finished = time.perf_counter()
+        frames = turn["frames"]
+        results.append({
+            "response_id": turn["request"]['response_id'],
+            "interaction_type": turn["request"]['interaction_type'],
+            "transcript_utterances": len(turn["request"]['transcript']),
+            "cached": "prepare_ms" not in turn_stats,
+            **{key: round(value, 2) for key, value in turn_stats.items()},
+            "first_event_ms": round((first_event_at - started) * 1000, 2) if first_event_at else None,
+            "total_ms": round((finished - started) * 1000, 2),
+            "recorded_first_frame_ms": round(frames[0][0] * 1000, 1) if frames else None,
+            "recorded_total_ms": round(frames[-1][0] * 1000, 1) if frames else None,
+            "recorded_abandoned": not turn["completed"],
+        })
+    llm_client.context.close()
+    return header, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded calls (CALL_TRACE_DIR) through LlmClient.")
+    parser.add_argument("traces", nargs="+", help="Trace files, or directories of them")
+    parser.add_argument("--live", action="store_true", help="Ask the real model instead of replaying recorded answers")
+    parser.add_argument("--realtime", action="store_true", help="Replay recorded answers at their recorded pace")
+    parser.add_argument("--no-response-cache", action="store_true", help="Send every turn through prepare_prompt")
+    parser.add_argument("--output", help="Write every turn as JSONL here")
+    args = parser.parse_args(argv)
+
+    if args.no_response_cache:
+        os.environ['RESPONSE_CACHE_SIZE'] = "0"
+    if not args.live:
+        # LlmClient borrows the shared OpenAI clients even though the stub answers every turn
+        os.environ.setdefault('OPENAI_API_KEY', "replay")
+        os.environ.setdefault('OPENAI_ORGANIZATION_ID', "replay")
+
+    paths = []
+    for path in args.traces:
+        paths.extend(sorted(glob.glob(os.path.join(path, "*.trace"))) if os.path.isdir(path) else [path])
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for path in paths:
+            header, results = replay_call(path, live=args.live, realtime=args.realtime)
+            print(f"{header['call_id']}: {len(results)} turns")
+            print(f"  {'id':>4} {'type':<18} {'msgs':>5} {'tokens':>7} {'prepare':>8} {'first':>8} {'total':>8} "
+                  f"{'rec first':>10} {'rec total':>10}")
+            for result in results:
+                if output:
+                    output.write(json.dumps({"call_id": header['call_id'], **result}) + "\n")
+                print(
+                    f"  {result['response_id']:>4} {result['interaction_type']:<18} "
+                    f"{result.get('prompt_messages', '-'):>5} {result.get('prompt_tokens', '-'):>7} "
+                    f"{result.get('prepare_ms', '-'):>8} {result['first_event_ms'] or '-':>8} {result['total_ms']:>8} "
+                    f"{result['recorded_first_frame_ms'] or '-':>10} {result['recorded_total_ms'] or '-':>10}"
+                    + (" cached" if result['cached'] else "")
+                    + (" abandoned" if result['recorded_abandoned'] else "")
+                )
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
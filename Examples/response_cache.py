@@ -0,0 +1,183 @@
+import functools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+FILLER_WORDS = {"um", "uh", "er", "erm", "hmm", "mm", "uhm", "ah", "oh", "like", "please", "so", "well"}
+# Long utterances are almost never repeated word for word, so they are not worth caching
+MAX_CACHEABLE_WORDS = 16
+# Words that change what was ordered: the answer to an utterance containing them is specific to it
+ORDER_WORDS = {
+    "barbecue", "bbq", "garlic", "tikka", "olives", "olive", "mushrooms", "mushroom", "caramelized", "onions",
+    "onion", "eggplants", "eggplant", "small", "medium", "large", "extra", "no", "not", "without", "instead",
+    "don't", "remove", "cancel", "a", "an", "one", "two", "three", "four", "five", "six", "seven", "eight",
+    "nine", "ten", "half", "double",
+}
+# Once the caller has given personal details, later answers may repeat them back
+PERSONAL_DETAILS = re.compile(r"\b(my name|name is|this is|address|street|avenue|road|apartment|phone|number is)\b|\d")
+
+
+def normalize_utterance(text):
+    words = re.sub(r"[^\w\s']", " ", text.lower()).split()
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def order_fingerprint(transcript):
+    """
+    The order-relevant words the caller has said so far, in order: two calls
+    share cached answers only if they ordered the same things the same way.
+    """
+    return " ".join(
+        word
+        for utterance in transcript if utterance['role'] == "user"
+        for word in normalize_utterance(utterance['content']).split() if word in ORDER_WORDS
+    )
+
+
+def has_order_details(utterance):
+    return any(word in ORDER_WORDS for word in utterance.split())
+
+
+def cache_key(transcript):
+    """
+    (state, utterance) for the turn being answered, or None if it should not be cached.
+
+    The state is what the agent said last, which is what the user is reacting to
+    ("yes" only means something together with the question before it), plus
+    the caller's order so far, since answers like the final confirmation name
+    what was ordered. Turns after the caller gave a name, address or number
+    are never cached.
+    """
+    if not transcript or transcript[-1]['role'] != "user":
+        return None
+    utterance = normalize_utterance(transcript[-1]['content'])
+    if not utterance or len(utterance.split()) > MAX_CACHEABLE_WORDS:
+        return None
+    if any(u['role'] == "user" and PERSONAL_DETAILS.search(u['content'].lower()) for u in transcript):
+        return None
+    previous_agent = next((u['content'] for u in reversed(transcript[:-1]) if u['role'] == "agent"), "")
+    return f"{normalize_utterance(previous_agent)}|{order_fingerprint(transcript[:-1])}", utterance
+
+
+def split_into_chunks(text):
+    # Roughly the granularity OpenAI streams at, so downstream code sees familiar chunks
+    return re.findall(r"\S+\s*", text)
+
+
+class TokenJaccardTier:
+    """
+    Optional similarity tier: word-set Jaccard similarity between utterances
+    answered from the same state. Word sets cannot tell pizza types apart or
+    see negation, so utterances with order details are never matched here.
+    Any object with the same add/remove/lookup methods (e.g. an embedding
+    index) can be plugged in instead.
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.by_state = {}
+
+    def add(self, key):
+        state, utterance = key
+        if has_order_details(utterance):
+            return
+        self.by_state.setdefault(state, {})[key] = set(utterance.split())
+
+    def remove(self, key):
+        entries = self.by_state.get(key[0])
+        if entries is not None:
+            entries.pop(key, None)
+            if not entries:
+                del self.by_state[key[0]]
+
+    def lookup(self, key):
+        state, utterance = key
+        if has_order_details(utterance):
+            return None
+        words = set(utterance.split())
+        best_key, best_score = None, self.threshold
+        for candidate, candidate_words in self.by_state.get(state, {}).items():
+            score = len(words & candidate_words) / len(words | candidate_words)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+        return best_key
+
+
+class ResponseCache:
+    """
+    Process-wide cache of complete agent responses, shared by every call: an
+    exact-match tier on the normalized utterance, then a pluggable similarity
+    tier. Entries expire after `ttl_seconds` and the least recently used are
+    evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, similarity=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.entries = OrderedDict()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        # Off by default (1.0): only exact matches are served
+        threshold = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 1.0))
+        return cls(
+            max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 512)),
+            ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+            similarity=TokenJaccardTier(threshold) if threshold < 1 else None,
+        )
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        with self._lock:
+            content = self._get_valid(key)
+            if content is not None:
+                self.exact_hits += 1
+                return content
+            if self.similarity is not None:
+                similar_key = self.similarity.lookup(key)
+                content = self._get_valid(similar_key) if similar_key is not None else None
+                if content is not None:
+                    self.similar_hits += 1
+                    return content
+            self.misses += 1
+            return None
+
+    def set(self, key, content):
+        with self._lock:
+            self.entries[key] = (content, time.monotonic())
+            self.entries.move_to_end(key)
+            if self.similarity is not None:
+                self.similarity.add(key)
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                if self.similarity is not None:
+                    self.similarity.remove(evicted)
+
+    def _get_valid(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        content, created = entry
+        if time.monotonic() - created > self.ttl_seconds:
+            del self.entries[key]
+            if self.similarity is not None:
+                self.similarity.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return content
+
+
+@functools.lru_cache(maxsize=None)
+def get_response_cache():
+    # Process-wide, built on first use so settings from .env (loaded by server.py) apply
+    return ResponseCache.from_env()
@@ -1,12 +1,20 @@
 import json
 import os
+import random
+import time
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.websockets import WebSocketState
 from llm import LlmClient
+from frame_coalescer import FrameCoalescer
+from metrics import registry
+from speculative import SpeculativeDrafter
 from twilio_server import TwilioClient
-from retellclient.models import operations
+from call_registration import CallRegistrar
+from campaign import CampaignStore
+from call_trace import CallTraceRecorder
+from clients import warm_openai_pool
 from twilio.twiml.voice_response import VoiceResponse
 import asyncio
 
@@ -14,71 +22,137 @@ load_dotenv(override=True)
 
 app = FastAPI()
 
+# Fraction of inbound frames to log in full, for debugging transcripts (off by default)
+TRANSCRIPT_DEBUG_SAMPLE_RATE = float(os.getenv('TRANSCRIPT_DEBUG_SAMPLE_RATE', 0))
+# Draft responses from live transcript updates before Retell asks for them
+SPECULATIVE_DRAFTS = os.getenv('SPECULATIVE_DRAFTS', '').lower() in ('1', 'true', 'yes')
+
 twilio_client = TwilioClient()
+call_registrar = CallRegistrar(twilio_client.retell)
+# Outbound campaign results (see campaign.py), recorded from Twilio's callbacks
+campaign_store = CampaignStore(os.environ['CAMPAIGN_DB']) if os.getenv('CAMPAIGN_DB') else None
+
+
+if os.getenv('TWILIO_PHONE_NUMBER'):
+    twilio_client.register_phone_agent(os.environ['TWILIO_PHONE_NUMBER'], os.environ['RETELL_AGENT_ID'])#put your phone number
 
 
-twilio_client.register_phone_agent("", os.environ['RETELL_AGENT_ID'])#put your phone number
+@app.on_event("startup")
+async def warm_openai_connections():
+    # Each worker process opens its own pool before it accepts calls
+    await warm_openai_pool()
 
+@app.on_event("startup")
+async def warm_call_registrations():
+    # Have call IDs ready before the first webhook fires (RETELL_PREREGISTER_POOL_SIZE > 0)
+    if call_registrar.pool_size > 0:
+        asyncio.create_task(call_registrar.keep_warm(os.environ['RETELL_AGENT_ID']))
 
 @app.post("/twilio-voice-webhook/{agent_id_path}")
 async def handle_twilio_voice_webhook(request: Request, agent_id_path: str):
     try:
         # Check if it is machine
         post_data = await request.form()
+        if 'AnsweredBy' in post_data and campaign_store:
+            await asyncio.to_thread(campaign_store.record_amd, post_data['CallSid'], post_data['AnsweredBy'])
         if 'AnsweredBy' in post_data and post_data['AnsweredBy'] == "machine_start":
-            twilio_client.end_call(post_data['CallSid'])
+            await asyncio.to_thread(twilio_client.end_call, post_data['CallSid'])
             return PlainTextResponse("")
         elif 'AnsweredBy' in post_data:
             return PlainTextResponse("") 
 
-        call_response = twilio_client.retell.register_call(operations.RegisterCallRequestBody(
-            agent_id=agent_id_path, 
-            audio_websocket_protocol="twilio", 
-            audio_encoding="mulaw", 
-            sample_rate=8000
-        ))
-        if call_response.call_detail:
+        # Registration never blocks the event loop, and is bounded so Twilio gets its TwiML in time
+        try:
+            call_id = await call_registrar.register(agent_id_path, post_data.get('CallSid'))
+        except asyncio.TimeoutError:
+            if request.query_params.get('retry'):
+                raise
+            # Hold the line for a moment and ask again; the retry waits for the registration still in flight
+            print(f"Retell registration timed out for {agent_id_path}, redirecting")
             response = VoiceResponse()
-            start = response.connect()
-            start.stream(url=f"wss://api.retellai.com/audio-websocket/{call_response.call_detail.call_id}")
+            response.pause(length=1)
+            response.redirect(str(request.url.include_query_params(retry=1)))
             return PlainTextResponse(str(response), media_type='text/xml')
+
+        response = VoiceResponse()
+        start = response.connect()
+        start.stream(url=f"wss://api.retellai.com/audio-websocket/{call_id}")
+        return PlainTextResponse(str(response), media_type='text/xml')
     except Exception as err:
-        print(f"Error in twilio voice webhook: {err}")
+        print(f"Error in twilio voice webhook: {err!r}")
         return JSONResponse(status_code=500, content={"message": "Internal Server Error"})
 
+@app.post("/twilio-status-callback")
+async def handle_twilio_status_callback(request: Request):
+    post_data = await request.form()
+    if campaign_store and 'CallSid' in post_data and 'CallStatus' in post_data:
+        await asyncio.to_thread(campaign_store.record_status, post_data['CallSid'], post_data['CallStatus'])
+    return PlainTextResponse("")
+
+@app.get("/metrics")
+async def handle_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/llm-websocket/{call_id}")
 async def websocket_handler(websocket: WebSocket, call_id: str):
     await websocket.accept()
     print(f"Handle llm ws for: {call_id}")
 
-    llm_client = LlmClient()
+    call_metrics = registry.call(call_id)
+    llm_client = LlmClient(metrics=call_metrics)
+    speculative = SpeculativeDrafter(llm_client) if SPECULATIVE_DRAFTS else None
+    # Opt-in wire-level record of the call for offline replay (set CALL_TRACE_DIR, see replay.py)
+    trace = CallTraceRecorder.for_call(call_id)
+    send_text = trace.wrap_send(websocket.send_text) if trace else websocket.send_text
 
     # send first message to signal ready of server
     response_id = 0
     first_event = llm_client.draft_begin_messsage()
-    await websocket.send_text(json.dumps(first_event))
-
-    async def stream_response(request):
-        nonlocal response_id
-        for event in llm_client.draft_response(request):
-            await websocket.send_text(json.dumps(event))
-            if request['response_id'] < response_id:
-                return # new response needed, abondon this one
+    await send_text(json.dumps(first_event))
+
+    # The one in-flight response for this call; a newer response_id cancels it
+    response_task = None
+
+    async def stream_response(request, received_at):
+        try:
+            events = speculative.respond(request) if speculative else llm_client.draft_response_async(request)
+            coalescer = FrameCoalescer(send_text, llm_client.coalescing, call_metrics)
+            await coalescer.stream(events, received_at)
+        except Exception as e:
+            print(f"Error streaming response {request['response_id']} for {call_id}: {e}")
     try:
         while True:
             message = await websocket.receive_text()
+            received_at = time.perf_counter()
+            if trace:
+                trace.record("in", message)
             request = json.loads(message)
-            # print out transcript
-            os.system('cls' if os.name == 'nt' else 'clear')
-            print(json.dumps(request, indent=4))
-            
+            if TRANSCRIPT_DEBUG_SAMPLE_RATE and random.random() < TRANSCRIPT_DEBUG_SAMPLE_RATE:
+                print(f"{call_id}: {message}")
+
             if 'response_id' not in request:
+                if speculative and speculative.enabled:
+                    speculative.on_transcript_update(request)
                 continue # no response needed, process live transcript update if needed
             response_id = request['response_id']
-            asyncio.create_task(stream_response(request))
+            if response_task is not None and not response_task.done():
+                response_task.cancel()
+                call_metrics.inc("abandoned")
+            call_metrics.inc("responses")
+            response_task = asyncio.create_task(stream_response(request, received_at))
     except WebSocketDisconnect:
         print(f"LLM WebSocket disconnected for {call_id}")
     except Exception as e:
         print(f'LLM WebSocket error for {call_id}: {e}')
     finally:
-        print(f"LLM WebSocket connection closed for {call_id}")
\ No newline at end of file
+        if response_task is not None:
+            response_task.cancel()
+        llm_client.context.close()
+        if speculative:
+            speculative.close()
+            print(f"Speculative drafts for {call_id}: {speculative.hits} used, {speculative.misses} missed, "
+                  f"{speculative.wasted_tokens} tokens wasted")
+        call_metrics.close()
+        if trace:
+            trace.close()
+        print(f"LLM WebSocket connection closed for {call_id} ({call_metrics.summary()})")
\ No newline at end of file
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+
+# Only the tail of the transcript decides what the next response should be
+FINGERPRINT_UTTERANCES = 4
+
+
+def transcript_fingerprint(transcript):
+    digest = hashlib.sha1(str(len(transcript)).encode())
+    for utterance in transcript[-FINGERPRINT_UTTERANCES:]:
+        digest.update(b"\0" + utterance['role'].encode())
+        digest.update(b"\0" + " ".join(utterance['content'].lower().split()).encode())
+    return digest.hexdigest()
+
+
+class Draft:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.events = []
+        self.tokens = 0
+        self.done = False
+        self.failed = False
+        self.claimed = False
+        self.updated = asyncio.Event()
+        self.task = None
+
+
+class SpeculativeDrafter:
+    """
+    Starts drafting a response from live transcript updates as soon as the user's
+    utterance has been stable for `stable_delay` seconds, before Retell asks for it.
+
+    When the real response_id arrives and its transcript has the same fingerprint
+    as a draft, the tokens drafted so far are flushed straight away and the rest is
+    streamed as it arrives. Drafts that do not match are discarded; their tokens
+    count as wasted, and once `max_wasted_tokens` is reached the call stops
+    speculating.
+    """
+
+    def __init__(self, llm_client, stable_delay=None, max_draft_tokens=None, max_wasted_tokens=None, max_drafts=2):
+        self.llm_client = llm_client
+        self.stable_delay = stable_delay if stable_delay is not None else float(os.getenv('SPECULATIVE_STABLE_MS', 300)) / 1000
+        self.max_draft_tokens = max_draft_tokens or int(os.getenv('SPECULATIVE_MAX_DRAFT_TOKENS', 80))
+        self.max_wasted_tokens = max_wasted_tokens or int(os.getenv('SPECULATIVE_MAX_WASTED_TOKENS', 1000))
+        self.max_drafts = max_drafts
+        self.drafts = OrderedDict()
+        self.wasted_tokens = 0
+        self.hits = 0
+        self.misses = 0
+        self._timer = None
+
+    @property
+    def enabled(self):
+        return self.wasted_tokens < self.max_wasted_tokens
+
+    def on_transcript_update(self, request):
+        """
+        Called for every frame without a response_id.
+        """
+        transcript = request.get('transcript') or []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.enabled or not transcript or transcript[-1]['role'] != "user":
+            return
+        fingerprint = transcript_fingerprint(transcript)
+        if fingerprint in self.drafts:
+            return
+        self._timer = asyncio.create_task(self._start_when_stable(fingerprint, transcript))
+
+    async def _start_when_stable(self, fingerprint, transcript):
+        # Any newer update cancels this timer, so getting past the sleep means the utterance settled
+        await asyncio.sleep(self.stable_delay)
+        self._timer = None
+        for stale in list(self.drafts.values()):
+            if not stale.done:
+                self._discard(stale)
+
+        draft = Draft(fingerprint)
+        draft.task = asyncio.create_task(self._draft(draft, transcript))
+        self.drafts[fingerprint] = draft
+        while len(self.drafts) > self.max_drafts:
+            self._discard(next(iter(self.drafts.values())))
+
+    async def _draft(self, draft, transcript):
+        request = {
+            "response_id": -1,
+            "interaction_type": "response_required",
+            "transcript": transcript,
+        }
+        try:
+            async for event in self.llm_client.draft_response_async(request):
+                draft.events.append(event)
+                if event['content']:
+                    draft.tokens += 1
+                draft.updated.set()
+                if not draft.claimed and draft.tokens > self.max_draft_tokens:
+                    # Too long to be worth guessing: give up and let the real request handle it
+                    draft.failed = True
+                    break
+        except asyncio.CancelledError:
+            draft.failed = True
+            raise
+        except Exception as err:
+            print(f"Speculative draft failed: {err}")
+            draft.failed = True
+        finally:
+            draft.done = True
+            draft.updated.set()
+
+    def _discard(self, draft):
+        self.drafts.pop(draft.fingerprint, None)
+        if draft.task is not None and not draft.task.done():
+            draft.task.cancel()
+        self.wasted_tokens += draft.tokens
+
+    def claim(self, request):
+        """
+        The usable draft for this response request, if any. Every other draft is discarded.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        draft = None
+        if request['interaction_type'] == "response_required":
+            draft = self.drafts.pop(transcript_fingerprint(request['transcript']), None)
+        for other in list(self.drafts.values()):
+            self._discard(other)
+        if draft is not None and draft.failed and draft.done:
+            self.wasted_tokens += draft.tokens
+            draft = None
+        if draft is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            draft.claimed = True
+        return draft
+
+    async def respond(self, request):
+        """
+        Drop-in replacement for LlmClient.draft_response_async that serves a matching draft if there is one.
+        """
+        draft = self.claim(request)
+        if draft is None:
+            async for event in self.llm_client.draft_response_async(request):
+                yield event
+            return
+
+        index = 0
+        try:
+            while True:
+                while index < len(draft.events):
+                    event = dict(draft.events[index], response_id=request['response_id'])
+                    index += 1
+                    yield event
+                if draft.done:
+                    break
+                draft.updated.clear()
+                await draft.updated.wait()
+        finally:
+            # Superseded while the draft was still streaming: stop it like any other response
+            if not draft.done:
+                draft.task.cancel()
+
+        if draft.failed:
+            # The draft stopped early; only restart from scratch if nothing was said yet
+            if index == 0:
+                async for event in self.llm_client.draft_response_async(request):
+                    yield event
+            else:
+                yield {
+                    "response_id": request['response_id'],
+                    "content": "",
+                    "content_complete": True,
+                    "end_call": False,
+                }
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        for draft in list(self.drafts.values()):
+            self._discard(draft)
@@ -1,13 +1,112 @@
-from twilio.rest import Client
-import retellclient
+from clients import get_retell_client, get_twilio_client
+from twilio.base.exceptions import TwilioRestException
 import os
+import threading
+import time
 
 class TwilioClient:
     def __init__(self):
-        self.client = Client(os.environ['TWILIO_ACCOUNT_ID'], os.environ['TWILIO_AUTH_TOKEN'])
-        self.retell = retellclient.RetellClient(
-            api_key=os.environ['RETELL_API_KEY'],
-        )
+        # Shared, pooled clients: every TwilioClient in the process reuses the same connections
+        self.client = get_twilio_client()
+        self.retell = get_retell_client()
+        # Phone number -> SID for the whole account, so lookups do not list numbers every time
+        self.number_index_ttl = float(os.getenv('TWILIO_NUMBER_INDEX_TTL', 300))
+        self._number_sids = {}
+        self._number_index_loaded_at = None
+        self._number_index_refreshing = False
+        self._number_index_lock = threading.Lock()
+        # Numbers added (SID) or removed (None) while a listing is in progress, replayed onto it when it lands
+        self._refreshes_running = 0
+        self._changes_during_refresh = {}
+
+    # Page through every number in the account (not just the first 200) and rebuild the index
+    def refresh_number_index(self):
+        with self._number_index_lock:
+            self._refreshes_running += 1
+        try:
+            number_sids = {}
+            for phone_number_object in self.client.incoming_phone_numbers.stream(page_size=1000):
+                number_sids[phone_number_object.phone_number] = phone_number_object.sid
+            with self._number_index_lock:
+                # The listing is a snapshot from before these changes; without them a deleted
+                # number would come back and a new one would go missing
+                for phone_number, number_sid in self._changes_during_refresh.items():
+                    if number_sid is None:
+                        number_sids.pop(phone_number, None)
+                    else:
+                        number_sids[phone_number] = number_sid
+                self._number_sids = number_sids
+                self._number_index_loaded_at = time.monotonic()
+            return number_sids
+        finally:
+            with self._number_index_lock:
+                self._refreshes_running -= 1
+                if not self._refreshes_running:
+                    self._changes_during_refresh = {}
+
+    # Record a number's SID (None: it is gone) in the index
+    def _index_number(self, phone_number, number_sid):
+        with self._number_index_lock:
+            if number_sid is None:
+                self._number_sids.pop(phone_number, None)
+            else:
+                self._number_sids[phone_number] = number_sid
+            if self._refreshes_running:
+                self._changes_during_refresh[phone_number] = number_sid
+
+    def _refresh_number_index_in_background(self):
+        try:
+            self.refresh_number_index()
+        except Exception as err:
+            print(f"Could not refresh the phone number index: {err}")
+        finally:
+            with self._number_index_lock:
+                self._number_index_refreshing = False
+
+    # Load the index on first use; once it is stale, rebuild it on a thread and keep serving the old one
+    def _ensure_number_index(self, background=True):
+        with self._number_index_lock:
+            loaded_at = self._number_index_loaded_at
+            stale = loaded_at is not None and time.monotonic() - loaded_at > self.number_index_ttl
+            start_refresh = background and stale and not self._number_index_refreshing
+            if start_refresh:
+                self._number_index_refreshing = True
+        if loaded_at is None or (stale and not background):
+            self.refresh_number_index()
+        elif start_refresh:
+            threading.Thread(target=self._refresh_number_index_in_background, daemon=True).start()
+
+    # Look up the SID of a number in this account, or None if it is not there
+    def find_number_sid(self, phone_number, refresh=True):
+        if refresh:
+            self._ensure_number_index()
+        with self._number_index_lock:
+            number_sid = self._number_sids.get(phone_number)
+        if number_sid is not None:
+            return number_sid
+        # Bought since the last refresh (e.g. from the console): fetch just this number
+        matches = self.client.incoming_phone_numbers.list(phone_number=phone_number, limit=1)
+        if not matches:
+            return None
+        self._index_number(phone_number, matches[0].sid)
+        return matches[0].sid
+
+    # Update a number's configuration; None if it is not in the account
+    def _update_number(self, phone_number, refresh=True, **fields):
+        number_sid = self.find_number_sid(phone_number, refresh)
+        if number_sid is None:
+            return None
+        try:
+            return self.client.incoming_phone_numbers(number_sid).update(**fields)
+        except TwilioRestException as err:
+            if err.status != 404:
+                raise
+        # Released since it was indexed (or bought again under a new SID): forget it and look once more
+        self._index_number(phone_number, None)
+        number_sid = self.find_number_sid(phone_number, refresh=False)
+        if number_sid is None:
+            return None
+        return self.client.incoming_phone_numbers(number_sid).update(**fields)
 
     # Create a new phone number and route it to use this server.
     def create_phone_number(self, area_code, agent_id):
@@ -19,6 +118,7 @@ class TwilioClient:
             phone_number_object = self.client.incoming_phone_numbers.create(
                 phone_number=local_number[0].phone_number, 
                 voice_url=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}")
+            self._index_number(phone_number_object.phone_number, phone_number_object.sid)
             print("Getting phone number:", vars(phone_number_object))
             return phone_number_object
         except Exception as err:
@@ -27,33 +127,48 @@ class TwilioClient:
     # Update this phone number to use provided agent id. Also updates voice URL address.
     def register_phone_agent(self, phone_number, agent_id):
         try:
-            phone_number_objects = self.client.incoming_phone_numbers.list(limit=200)
-            number_sid = ''
-            for phone_number_object in phone_number_objects:
-                if phone_number_object.phone_number == phone_number:
-                    number_sid = phone_number_object.sid
-            if number_sid is None:
+            phone_number_object = self._update_number(
+                phone_number, voice_url=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}")
+            if phone_number_object is None:
                 print("Unable to locate this number in your Twilio account, is the number you used in BCP 47 format?")
                 return
-            phone_number_object = self.client.incoming_phone_numbers(number_sid).update(
-                voice_url=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}")
             print("Register phone agent:", vars(phone_number_object))
             return phone_number_object
         except Exception as err:
             print(err)
+
+    # Point many numbers at the same agent, using the index instead of a listing per number
+    def register_phone_agents(self, phone_numbers, agent_id):
+        voice_url = f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}"
+        updated = []
+        # At most one listing for the whole batch, up front rather than partway through it
+        self._ensure_number_index(background=False)
+        for phone_number in phone_numbers:
+            try:
+                phone_number_object = self._update_number(phone_number, refresh=False, voice_url=voice_url)
+                if phone_number_object is None:
+                    print(f"Unable to locate {phone_number} in your Twilio account, is the number you used in BCP 47 format?")
+                    continue
+                updated.append(phone_number_object)
+            except Exception as err:
+                print(f"Could not register {phone_number}: {err}")
+        print(f"Registered {len(updated)} of {len(phone_numbers)} phone numbers to agent {agent_id}")
+        return updated
     
     # Release a phone number
     def delete_phone_number(self, phone_number):
         try:
-            phone_number_objects = self.client.incoming_phone_numbers.list(limit=200)
-            number_sid = ''
-            for phone_number_object in phone_number_objects:
-                if phone_number_object.phone_number == phone_number:
-                    number_sid = phone_number_object.sid
+            number_sid = self.find_number_sid(phone_number)
             if number_sid is None:
                 print("Unable to locate this number in your Twilio account, is the number you used in BCP 47 format?")
                 return
-            phone_number_object = self.client.incoming_phone_numbers(number_sid).delete()
+            try:
+                phone_number_object = self.client.incoming_phone_numbers(number_sid).delete()
+            except TwilioRestException as err:
+                if err.status != 404:
+                    raise
+                phone_number_object = None  # already released elsewhere
+            self._index_number(phone_number, None)
             print("Removed phone number:", phone_number)
             return phone_number_object
         except Exception as err:
@@ -79,18 +194,28 @@ class TwilioClient:
         except Exception as err:
             print(err)
     
+    # Place an outbound call and return it; errors are raised so callers can decide to retry
+    def place_phone_call(self, from_number, to_number, agent_id):
+        return self.client.calls.create(
+            machine_detection="Enable", # detects if the other party is IVR
+            machine_detection_timeout=8,
+            async_amd="true", # call webhook when determined whether it is machine
+            async_amd_status_callback=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}", # Webhook url for machine detection
+            url=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}", 
+            status_callback=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-status-callback", # call progress, for campaign tracking
+            status_callback_event=["initiated", "ringing", "answered", "completed"],
+            to=to_number, 
+            from_=from_number
+        )
+
     # Create an outbound call
     def create_phone_call(self, from_number, to_number, agent_id):
         try:
-            self.client.calls.create(
-                machine_detection="Enable", # detects if the other party is IVR
-                machine_detection_timeout=8,
-                async_amd="true", # call webhook when determined whether it is machine
-                async_amd_status_callback=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}", # Webhook url for machine detection
-                url=f"{os.getenv('NGROK_IP_ADDRESS')}/twilio-voice-webhook/{agent_id}", 
-                to=to_number, 
-                from_=from_number
-            )
+            call = self.place_phone_call(from_number, to_number, agent_id)
             print(f"Call from: {from_number} to: {to_number}")
+            return call
         except Exception as err:
             print(err)
+
+    def fetch_call_status(self, sid):
+        return self.client.calls(sid).fetch().status
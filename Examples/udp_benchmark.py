@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import statistics
+import time
+from make_outbound_call import RetellAIUDPClient
+from udp_echo_server import serve
+
+
+async def conversation(client, messages, text, latencies):
+    started = time.perf_counter()
+    response = await client.start_conversation("benchmark")
+    latencies.append(time.perf_counter() - started)
+    for _ in range(messages):
+        started = time.perf_counter()
+        await client.send_message(response["conversation_id"], text)
+        latencies.append(time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput of many conversations over one UDP socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12346)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20, help="Messages per conversation")
+    parser.add_argument("--message-bytes", type=int, default=200, help="Use more than 1200 to exercise chunking")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Datagram loss at the local echo server")
+    parser.add_argument("--external", action="store_true", help="Use a server already running at --host/--port")
+    args = parser.parse_args()
+
+    server = None
+    if not args.external:
+        server, _ = await serve(args.host, args.port, args.drop_rate)
+    client = await RetellAIUDPClient(args.host, args.port).connect()
+    latencies = []
+    text = "x" * args.message_bytes
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(conversation(client, args.messages, text, latencies) for _ in range(args.conversations)),
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - started
+    client.close()
+    if server is not None:
+        server.close()
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    latencies.sort()
+    print(f"{args.conversations} conversations x {args.messages} messages over one socket in {elapsed:.2f}s")
+    print(f"requests/s: {len(latencies) / elapsed:.0f}, retransmits: {client.retransmits}, failed conversations: {len(failures)}")
+    if latencies:
+        print(f"latency ms: p50={statistics.median(latencies) * 1000:.2f} "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import random
+import uuid
+from collections import OrderedDict
+from udp_protocol import DEFAULT_CHUNK_SIZE, Reassembler, encode_datagrams
+
+
+class EchoServerProtocol(asyncio.DatagramProtocol):
+    """
+    Local stand-in for the Retell UDP endpoint: "start" opens a conversation,
+    "message" echoes the text back. Replies are remembered per request id, so a
+    retransmitted request gets the same reply instead of being handled twice.
+    `drop_rate` of incoming datagrams are dropped to exercise retransmission.
+    """
+
+    def __init__(self, drop_rate=0.0, delay=0.0, max_replies=50000):
+        self.drop_rate = drop_rate
+        self.delay = delay
+        self.max_replies = max_replies
+        self.reassembler = Reassembler()
+        self.replies = OrderedDict()
+        self.conversations = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.drop_rate and random.random() < self.drop_rate:
+            return
+        complete = self.reassembler.feed(addr, data)
+        if complete is None:
+            return
+        request_id, message = complete
+        key = (addr, request_id)
+        if key in self.replies:
+            self._send(self.replies[key], addr)
+            return
+        reply = encode_datagrams(request_id, self.handle(message), DEFAULT_CHUNK_SIZE)
+        self.replies[key] = reply
+        while len(self.replies) > self.max_replies:
+            self.replies.popitem(last=False)
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self._send, reply, addr)
+        else:
+            self._send(reply, addr)
+
+    def _send(self, datagrams, addr):
+        for datagram in datagrams:
+            self.transport.sendto(datagram, addr)
+
+    def handle(self, message):
+        payload = message.get("payload", {})
+        if message.get("type") == "start":
+            conversation_id = uuid.uuid4().hex
+            self.conversations[conversation_id] = payload.get("context")
+            return {"conversation_id": conversation_id, "status": "started"}
+        if message.get("type") == "message":
+            if payload.get("conversation_id") not in self.conversations:
+                return {"error": "unknown conversation"}
+            return {"conversation_id": payload["conversation_id"], "text": payload.get("text")}
+        return {"error": f"unknown message type {message.get('type')}"}
+
+
+async def serve(host, port, drop_rate=0.0, delay=0.0):
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: EchoServerProtocol(drop_rate, delay), local_addr=(host, port)
+    )
+    return transport, protocol
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Local echo stand-in for the Retell UDP endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    transport, _ = await serve(args.host, args.port, args.drop_rate, args.delay)
+    print(f"UDP echo server on {args.host}:{args.port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
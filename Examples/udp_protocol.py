@@ -0,0 +1,67 @@
+import json
+import struct
+import time
+
+# Every datagram: request id, chunk index, chunk count, then a slice of the JSON message
+HEADER = struct.Struct("!QHH")
+# Keeps datagrams under a typical 1500-byte MTU so they are never IP-fragmented
+DEFAULT_CHUNK_SIZE = 1200
+MAX_CHUNKS = 0xFFFF
+
+
+def encode_datagrams(request_id, message, chunk_size=DEFAULT_CHUNK_SIZE):
+    data = json.dumps(message).encode()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)] or [b""]
+    if len(chunks) > MAX_CHUNKS:
+        raise ValueError(f"Message too large: {len(data)} bytes")
+    return [HEADER.pack(request_id, index, len(chunks)) + chunk for index, chunk in enumerate(chunks)]
+
+
+class Reassembler:
+    """
+    Collects chunks per (sender, request id) until a message is complete.
+    Partial messages are dropped after `ttl` seconds, and at most `max_partial`
+    are kept, so lost datagrams cannot grow memory without bound.
+    """
+
+    def __init__(self, ttl=10.0, max_partial=10000):
+        self.ttl = ttl
+        self.max_partial = max_partial
+        self.partial = {}
+        self._last_sweep = time.monotonic()
+
+    def feed(self, addr, datagram):
+        """
+        (request_id, message) once the last missing chunk arrives, otherwise None.
+        """
+        if len(datagram) < HEADER.size:
+            return None
+        request_id, index, total = HEADER.unpack_from(datagram)
+        chunk = datagram[HEADER.size:]
+        if total == 1:
+            return request_id, json.loads(chunk)
+        if index >= total:
+            return None
+
+        now = time.monotonic()
+        if now - self._last_sweep > self.ttl:
+            self._sweep(now)
+        key = (addr, request_id)
+        entry = self.partial.get(key)
+        if entry is None:
+            if len(self.partial) >= self.max_partial:
+                return None
+            entry = self.partial[key] = {"chunks": [None] * total, "missing": total, "updated": now}
+        if entry["chunks"][index] is None:
+            entry["chunks"][index] = chunk
+            entry["missing"] -= 1
+        entry["updated"] = now
+        if entry["missing"]:
+            return None
+        del self.partial[key]
+        return request_id, json.loads(b"".join(entry["chunks"]))
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        for key in [key for key, entry in self.partial.items() if now - entry["updated"] > self.ttl]:
+            del self.partial[key]
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(image_bytes, prompt, model_name, extra=""):
+    """
+    Content-addressed key for one vision request.
+
+    Parameters:
+    - image_bytes (bytes): The raw image as uploaded/captured.
+    - prompt (str): The text prompt sent alongside the image.
+    - model_name (str): The vision model answering the prompt.
+    - extra (str): Anything else that changes the answer (e.g. preprocessing settings).
+    """
+    digest = hashlib.sha256(image_bytes)
+    for part in (prompt, model_name, extra):
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-level cache for image analysis results: an in-memory LRU in front of an
+    optional on-disk store evicted by age (TTL) and total size.
+
+    Eviction scans the whole cache directory, so it runs on the first write and
+    then only every `evict_interval` seconds, or sooner once a tenth of the
+    size budget has been written since the last scan.
+    """
+
+    def __init__(self, max_entries=128, disk_dir=None, disk_max_bytes=50 * 1024 * 1024, ttl_seconds=7 * 24 * 3600,
+                 evict_interval=60.0):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted_at = None
+        self._written_since_evict = 0
+        self._evicting = False
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv('ANALYSIS_CACHE_SIZE', 128)),
+            disk_dir=os.getenv('ANALYSIS_CACHE_DIR') or None,
+            disk_max_bytes=int(float(os.getenv('ANALYSIS_CACHE_MAX_MB', 50)) * 1024 * 1024),
+            ttl_seconds=float(os.getenv('ANALYSIS_CACHE_TTL', 7 * 24 * 3600)),
+            evict_interval=float(os.getenv('ANALYSIS_CACHE_EVICT_INTERVAL', 60)),
+        )
+
+    def get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry['created']):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry['content']
+            if entry is not None:
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None:
+                self._remember(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry['content']
+            self.misses += 1
+            return None
+
+    def set(self, key, content):
+        entry = {"content": content, "created": time.time()}
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def get_or_compute(self, key, compute):
+        content = self.get(key)
+        if not content:
+            content = compute()
+            # An empty answer would otherwise be served for this key from now on
+            if content:
+                self.set(key, content)
+        return content
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._memory),
+            }
+
+    def _expired(self, created):
+        return self.ttl_seconds is not None and time.time() - created > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry.get('created', 0)):
+            self._remove(path)
+            return None
+        return entry
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+                written = f.tell()
+            os.replace(tmp_path, path)
+        except OSError as err:
+            print(f"Could not write analysis cache entry: {err}")
+            self._remove(tmp_path)
+            return
+        if self._eviction_due(written):
+            try:
+                self._evict_disk()
+            finally:
+                with self._lock:
+                    self._evicting = False
+
+    def _eviction_due(self, written):
+        # Claims the sweep for this thread when one is due, so concurrent writers do not all scan
+        now = time.monotonic()
+        with self._lock:
+            self._written_since_evict += written
+            due = (
+                self._evicted_at is None
+                or now - self._evicted_at >= self.evict_interval
+                or self._written_since_evict >= self.disk_max_bytes / 10
+            )
+            if not due or self._evicting:
+                return False
+            self._evicting = True
+            self._evicted_at = now
+            self._written_since_evict = 0
+            return True
+
+    def _evict_disk(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self._expired(stat.st_mtime):
+                self._remove(path)
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        # Oldest entries go first until we are back under the size budget
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import openai
+from dotenv import load_dotenv
+from analysis_cache import AnalysisCache
+from clients import get_chat_model
+from image_preprocess import preprocess_image, preprocess_settings_from_env
+from vision import VISION_MODEL, WEATHER_PROMPT, analysis_cache_key, build_vision_message
+load_dotenv()
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def iter_directory(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def iter_manifest(manifest):
+    # One path per line, or JSONL lines carrying a "path" field
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                yield json.loads(line)["path"]
+            else:
+                yield line
+
+
+def load_checkpoint(output):
+    """
+    Paths already analyzed successfully in a previous run of the same output file.
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written last line of an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["path"])
+    return done
+
+
+def retry_delay(err, attempt, base_delay, max_delay):
+    response = getattr(err, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    # Full jitter so workers that hit the limit together do not retry together
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class BatchAnalyzer:
+    def __init__(self, model, concurrency=8, max_retries=6, base_delay=1.0, max_delay=60.0,
+                 prompt=WEATHER_PROMPT, preprocess_settings=None, cache=None):
+        self.model = model
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.prompt = prompt
+        self.preprocess_settings = preprocess_settings or preprocess_settings_from_env()
+        self.cache = cache
+        self.counts = {"ok": 0, "error": 0, "retries": 0, "cached": 0}
+
+    async def analyze(self, path):
+        started = time.monotonic()
+        with open(path, "rb") as f:
+            bytes_data = f.read()
+        key = analysis_cache_key(bytes_data, self.prompt, self.model.model_name, self.preprocess_settings)
+        if self.cache is not None:
+            # The cache reads and writes files; keep that off the event loop
+            content = await asyncio.to_thread(self.cache.get, key)
+            if content:
+                self.counts["cached"] += 1
+                return self._record(path, "ok", started, analysis=content, cached=True)
+
+        prepared = await asyncio.to_thread(preprocess_image, bytes_data, **self.preprocess_settings)
+        del bytes_data
+
+        message = build_vision_message(prepared.data_url, self.prompt, prepared.detail)
+        attempt = 0
+        while True:
+            try:
+                response = await self.model.ainvoke([message])
+                break
+            except RETRYABLE_ERRORS as err:
+                if attempt >= self.max_retries:
+                    raise
+                self.counts["retries"] += 1
+                await asyncio.sleep(retry_delay(err, attempt, self.base_delay, self.max_delay))
+                attempt += 1
+
+        if self.cache is not None and response.content:
+            await asyncio.to_thread(self.cache.set, key, response.content)
+        return self._record(path, "ok", started, analysis=response.content, attempts=attempt + 1,
+                            tokens_saved=prepared.tokens_saved)
+
+    def _record(self, path, status, started, **fields):
+        return {"path": path, "status": status, "seconds": round(time.monotonic() - started, 3), **fields}
+
+    async def run(self, paths, output):
+        """
+        Analyze every path not already recorded in `output`, appending one JSONL record per image.
+        """
+        done = load_checkpoint(output)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        with open(output, "a", encoding="utf-8") as out:
+            async def worker():
+                while True:
+                    path = await queue.get()
+                    if path is None:
+                        return
+                    started = time.monotonic()
+                    try:
+                        record = await self.analyze(path)
+                    except Exception as err:
+                        record = self._record(path, "error", started, error=f"{type(err).__name__}: {err}")
+                    self.counts[record["status"]] += 1
+                    # Written and flushed per image so an interrupted run resumes where it stopped
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            skipped = 0
+            for path in paths:
+                if path in done:
+                    skipped += 1
+                    continue
+                await queue.put(path)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+        return {**self.counts, "skipped": skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Describe the weather in a batch of images.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--directory", help="Walk this directory for images")
+    source.add_argument("--manifest", help="File listing one image path (or JSON object with a path) per line")
+    parser.add_argument("--output", required=True, help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-retries", type=int, default=6)
+    parser.add_argument("--model", default=VISION_MODEL)
+    parser.add_argument("--cache-dir", default=os.getenv('ANALYSIS_CACHE_DIR'),
+                        help="Share the on-disk analysis cache with the Streamlit apps")
+    args = parser.parse_args(argv)
+
+    # Retries are handled by the analyzer so that backoff is coordinated with the concurrency limit,
+    # and the pool has a connection for every worker so --concurrency is not capped by HTTP_MAX_CONNECTIONS
+    model = get_chat_model(args.model, max_retries=0, max_connections=args.concurrency)
+    cache = AnalysisCache(disk_dir=args.cache_dir) if args.cache_dir else None
+    analyzer = BatchAnalyzer(model, concurrency=args.concurrency, max_retries=args.max_retries, cache=cache)
+    paths = iter_directory(args.directory) if args.directory else iter_manifest(args.manifest)
+
+    started = time.monotonic()
+    summary = asyncio.run(analyzer.run(paths, args.output))
+    summary["seconds"] = round(time.monotonic() - started, 1)
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
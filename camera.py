@@ -1,13 +1,16 @@
 import streamlit as st
-from PIL import Image
-import base64
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
-import requests
+from analysis_cache import AnalysisCache
+from clients import create_web_call, get_chat_model, update_call
+from concurrent.futures import ThreadPoolExecutor
+from image_preprocess import read_image_info
+from timeline import Timeline
+from vision import VISION_MODEL, stream_analysis
+from web_call_socket import WebCallConnectionManager
+import altair as alt
+import hashlib
 import json
 import os
-import asyncio
-import websockets
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -17,6 +20,17 @@ with st.sidebar:
     "[Get an OpenAI API key](https://platform.openai.com/account/api-keys)"
     "[View the source code](https://github.com/streamlit/llm-examples/blob/main/Chatbot.py)"
     "[![Open in GitHub Codespaces](https://github.com/codespaces/badge.svg)](https://codespaces.new/streamlit/llm-examples?quickstart=1)"
+    # Create the call while the image is still being analyzed, then hand it the description.
+    # Off by default: it starts a billable call for every new picture without a click
+    pipelined = st.checkbox(
+        "Start the web call while the image is analyzed",
+        value=False,
+        help="Every new picture then creates a (billable) Retell web call automatically",
+    )
+    metadata = st.text_area("Enter Metadata (JSON format)", value="{}")
+
+agent_id = os.getenv('RETELL_AGENT_ID')
+retell_ai_api_key = os.getenv('RETELL_API_KEY')
 
 # Title of the app
 st.title("Capture and Display Image")
@@ -24,41 +38,82 @@ st.title("Capture and Display Image")
 # Capture image from camera
 captured_image = st.camera_input("Take a picture")
 
-async def connect_websocket(call_data):
+@st.cache_resource
+def get_analysis_cache():
+    # One cache per process, shared by every session and rerun
+    return AnalysisCache.from_env()
+
+
+@st.cache_resource
+def get_connection_manager():
+    # One background event loop per process owns every web call's websocket
+    return WebCallConnectionManager()
+
+
+@st.cache_resource
+def get_call_executor():
+    # Call setup runs here so it overlaps with the analysis streaming on the script thread
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="web-call-setup")
+
+
+def session_alive_check():
     """
-    Establish a WebSocket connection using the information from the call_data.
-    
-    Parameters:
-    - call_data (dict): The response data from which the access_token and websocket_url will be extracted.
+    A callable that says whether this browser session is still open, so the
+    connection manager can hang up its call once the tab is closed; None where
+    the Streamlit runtime cannot tell.
     """
     try:
-        # Extract access_token and websocket_url from the call_data
-        access_token = call_data.get('access_token')
-        
-        if not access_token:
-            raise ValueError("Missing access_token or websocket_url in call_data")
-
-        # Establish WebSocket connection
-        async with websockets.connect(f"wss://https://api.retellai.com/v2/create-web-call") as ws:
-            # Send the access token for authentication
-            await ws.send(json.dumps({
-                "type": "connect",
-                "access_token": access_token
-            }))
-            
-            # Wait for the connection to be established
-            response = await ws.recv()
-            print("WebSocket connection established successfully")
-            print(f"Received: {response}")
-            
-            # You can keep the connection open or handle further communication here
-            # For example, continuously listen to the WebSocket
-            while True:
-                message = await ws.recv()
-                print(f"Received message: {message}")
-                
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        from streamlit.runtime import get_instance
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        runtime = get_instance()
+    except (ImportError, AttributeError, RuntimeError):
+        return None  # not running under `streamlit run`, or a Streamlit without these APIs
+    if ctx is None:
+        return None
+    return lambda: runtime.is_active_session(ctx.session_id)
+
+
+def start_web_call(timeline, call_metadata, owner_alive=None):
+    """
+    Create the web call and open its websocket, recording both on `timeline`.
+    """
+    with timeline.stage("create web call"):
+        response = create_web_call(agent_id, metadata=call_metadata, api_key=retell_ai_api_key)
+    if response.status_code != 201:
+        return response, None
+    call_data = response.json()
+    connect_started = time.perf_counter()
+    connection = get_connection_manager().connect(
+        call_data.get('call_id'), call_data.get('access_token'), owner_alive=owner_alive
+    )
+    return response, (connection, connect_started)
+
+
+def abandon_web_call(call_future, manager):
+    """
+    Hang up a pipelined call that will never get its description, once its setup finishes.
+    """
+    def close(future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        _, started = future.result()
+        if started is not None:
+            manager.close(started[0].call_id)
+    call_future.add_done_callback(close)
+
+
+def show_timeline(records, critical_path):
+    st.write("Timeline:")
+    chart = alt.Chart(alt.Data(values=records)).mark_bar().encode(
+        x=alt.X("start_ms:Q", title="ms since capture"),
+        x2="end_ms:Q",
+        y=alt.Y("stage:N", sort=None, title=None),
+        tooltip=["stage:N", "start_ms:Q", "end_ms:Q"],
+    )
+    st.altair_chart(chart, use_container_width=True)
+    if critical_path:
+        st.caption("Critical path: " + " → ".join(critical_path))
 
 
 _size = st.empty()
@@ -72,71 +127,118 @@ if captured_image is not None:
     bytes_data = captured_image.getvalue()
     st.image(captured_image, caption='Captured Image', use_column_width=True)
 
-    # Show Image property
-    im = Image.open(captured_image)
-    # im.show()
-    _size.markdown(f"<h6>Image size : {str(im.size)}</h6>", unsafe_allow_html=True)
-    _mode.text("Image mode : " + str(im.mode))
-    _format.text("Image mode : " + str(im.format))
-    
-    image_base64 = base64.b64encode(bytes_data).decode("utf-8")
-    # _content.markdown(f"<h6>Image content : {image_base64}</h6>", unsafe_allow_html=True)
- 
-    model = ChatOpenAI(model="gpt-4o", openai_api_key=openai_api_key)
- 
-    message = HumanMessage(
-        content=[
-            {"type": "text", "text": "describe the weather in this image"},
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
-            },
-        ],
-    )
-    response = model.invoke([message])
-    st.write("Image Analysis:")
-    st.write(response.content)
+    timeline = Timeline()
+    # Only a new picture starts a new call; widget reruns with the same picture do not
+    image_key = hashlib.sha256(bytes_data).hexdigest()
+    call_future = None
+    if pipelined and agent_id and st.session_state.get('pipelined_image') != image_key:
+        st.session_state['pipelined_image'] = image_key
+        try:
+            call_future = get_call_executor().submit(
+                start_web_call, timeline, json.loads(metadata), session_alive_check()
+            )
+        except ValueError as e:
+            st.error(f"Invalid metadata: {e}")
 
-    agent_id = os.getenv('RETELL_AGENT_ID')
-    retell_ai_api_key = os.getenv('RETELL_API_KEY')
-    body = {
-        "agent_id": agent_id,
-        "inputText": response.content,
-    }
+    try:
+        # Only the header is read here; the image is decoded and downsampled only if its analysis is not cached
+        width, height, image_format, image_mode = read_image_info(bytes_data)
+        _size.markdown(f"<h6>Image size : {str((width, height))}</h6>", unsafe_allow_html=True)
+        _mode.text("Image mode : " + str(image_mode))
+        _format.text("Image mode : " + str(image_format))
 
-    metadata = st.text_area("Enter Metadata (JSON format)", value="{}")
+        model = get_chat_model(VISION_MODEL, openai_api_key)
 
-    # Make the API call to Retell AI
-    retell_ai_url = "https://api.retellai.com/v2/create-web-call"
-    headers = {
-        "Authorization": f"Bearer {retell_ai_api_key}",
-        "Content-Type": "application/json"
-    }
+        # Reruns (and repeat frames) hit the cache instead of re-sending the image
+        analysis_cache = get_analysis_cache()
+        st.write("Image Analysis:")
+        _analysis = st.empty()
+        timings = {}
+        analysis = ""
+        analysis_started = time.perf_counter()
+        for token in stream_analysis(model, bytes_data, analysis_cache, timings=timings,
+                                     on_prepared=lambda prepared: _content.caption(prepared.summary())):
+            analysis += token
+            _analysis.markdown(analysis)
+        if 'preprocess' in timings:
+            timeline.add("preprocess image", analysis_started, analysis_started + timings['preprocess'])
+        timeline.add("analysis: first token", analysis_started, analysis_started + timings.get('ttft', 0))
+        timeline.add("analysis", analysis_started, time.perf_counter())
+    except BaseException:
+        # Includes Streamlit's rerun/stop: let the next run start a fresh call for this picture
+        if call_future is not None:
+            st.session_state.pop('pipelined_image', None)
+            abandon_web_call(call_future, get_connection_manager())
+        raise
 
+    cache_stats = analysis_cache.stats()
+    st.sidebar.caption(f"Analysis cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    st.sidebar.caption(
+        f"Last analysis: first token {timings.get('ttft', 0):.2f}s, total {timings.get('total', 0):.2f}s"
+        + (" (cached)" if timings.get('cached') else "")
+    )
+    # Keep a short per-session history so slow requests can be spotted
+    st.session_state.setdefault('analysis_timings', []).append(timings)
+    del st.session_state['analysis_timings'][:-50]
 
+    if call_future is not None:
+        try:
+            response, started = call_future.result()
+            if started is None:
+                st.error(f"Failed to create web call. Status code: {response.status_code}")
+                st.json(response.json())
+            else:
+                connection, connect_started = started
+                call_data = response.json()
+                st.success(call_data)
+                # The call is already up; give the agent the description now that it exists
+                with timeline.stage("inject description"):
+                    update_response = update_call(
+                        connection.call_id,
+                        api_key=retell_ai_api_key,
+                        metadata={**json.loads(metadata), "weather_description": analysis},
+                        override_dynamic_variables={"weather_description": analysis},
+                    )
+                if update_response.status_code >= 400:
+                    st.warning(f"Could not pass the description to the call. Status code: {update_response.status_code}")
+                if connection.opened_at is not None:
+                    timeline.add("websocket open", connect_started, connection.opened_at)
+                if st.session_state.get('web_call_id'):
+                    get_connection_manager().close(st.session_state['web_call_id'])
+                st.session_state['web_call_id'] = connection.call_id
+                st.session_state['web_call_messages'] = []
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+            # Not recorded in the session, so nothing else would ever close it
+            abandon_web_call(call_future, get_connection_manager())
+        st.session_state['call_timeline'] = (timeline.records(), timeline.critical_path())
+
+    if 'call_timeline' in st.session_state:
+        show_timeline(*st.session_state['call_timeline'])
 
-    if st.button("Create Web Call") and all([agent_id, metadata]):
+    if not pipelined and st.button("Create Web Call") and all([agent_id, metadata]):
         try:
-            data = {
-                "agent_id": agent_id,
-                "metadata": json.loads(metadata),
-            }
-            
-            response = requests.post(
-                "https://api.retellai.com/v2/create-web-call",
-                headers=headers,
-                data=json.dumps(data)
+            # Goes through the shared keep-alive pool, so repeat calls skip the TLS handshake
+            call_metadata = {**json.loads(metadata), "weather_description": analysis}
+            response = create_web_call(
+                agent_id,
+                metadata=call_metadata,
+                api_key=retell_ai_api_key,
+                retell_llm_dynamic_variables={"weather_description": analysis},
             )
             
             if response.status_code == 201:
                 st.success(response.json())
                 call_data = response.json()
-                
-                # Extract the access token
-                asyncio.run(connect_websocket(call_data))
-                    
-                print("WebSocket connection established successfully")
 
+                # The websocket runs in the background; this rerun returns straight away
+                if st.session_state.get('web_call_id'):
+                    get_connection_manager().close(st.session_state['web_call_id'])
+                get_connection_manager().connect(
+                    call_data.get('call_id'), call_data.get('access_token'), owner_alive=session_alive_check()
+                )
+                st.session_state['web_call_id'] = call_data.get('call_id')
+                st.session_state['web_call_messages'] = []
 
             else:
                 st.error(f"Failed to create web call. Status code: {response.status_code}")
@@ -144,3 +246,22 @@ if captured_image is not None:
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
 
+# Reruns reuse the session's connection and only pick up what arrived since the last one
+call_id = st.session_state.get('web_call_id')
+connection = get_connection_manager().get(call_id) if call_id else None
+if connection is not None:
+    messages = st.session_state.setdefault('web_call_messages', [])
+    messages.extend(connection.poll())
+    del messages[:-50]
+    st.caption(
+        f"Web call {call_id}: {connection.status}"
+        + (f", {connection.reconnects} reconnects" if connection.reconnects else "")
+        + (f", {connection.dropped} messages dropped" if connection.dropped else "")
+    )
+    col_refresh, col_end = st.columns(2)
+    col_refresh.button("Check for messages")
+    if col_end.button("End web call"):
+        get_connection_manager().close(call_id)
+        del st.session_state['web_call_id']
+    for message in messages[-10:]:
+        st.text(message)
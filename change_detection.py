@@ -0,0 +1,89 @@
+import io
+from PIL import Image
+
+# Both signatures are computed from a tiny grayscale thumbnail, so they cost far less than decoding at full size
+HASH_SIZE = 8
+HISTOGRAM_SIZE = 64
+HISTOGRAM_BINS = 32
+
+
+def _thumbnail(bytes_data, size):
+    with Image.open(io.BytesIO(bytes_data)) as im:
+        # Let the JPEG decoder skip straight to a reduced scale
+        im.draft("L", (size * 4, size * 4))
+        return im.convert("L").resize((size, size), Image.BILINEAR)
+
+
+def average_hash(bytes_data, hash_size=HASH_SIZE):
+    """
+    Perceptual hash: one bit per thumbnail pixel, set where it is brighter than the mean.
+    """
+    pixels = list(_thumbnail(bytes_data, hash_size).getdata())
+    mean = sum(pixels) / len(pixels)
+    bits = 0
+    for pixel in pixels:
+        bits = (bits << 1) | (pixel > mean)
+    return bits
+
+
+def hash_distance(a, b, hash_size=HASH_SIZE):
+    # Fraction of differing bits, 0.0 (same scene) to 1.0
+    return bin(a ^ b).count("1") / (hash_size * hash_size)
+
+
+def histogram(bytes_data, bins=HISTOGRAM_BINS):
+    """
+    Normalized brightness histogram of a downsampled frame.
+    """
+    counts = _thumbnail(bytes_data, HISTOGRAM_SIZE).histogram()
+    step = 256 // bins
+    merged = [sum(counts[i:i + step]) for i in range(0, 256, step)]
+    total = sum(merged)
+    return [count / total for count in merged]
+
+
+def histogram_distance(a, b):
+    # Half the L1 distance between two normalized histograms, 0.0 to 1.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / 2
+
+
+METHODS = {
+    "hash": (average_hash, hash_distance),
+    "histogram": (histogram, histogram_distance),
+}
+
+
+class ChangeDetector:
+    """
+    Decides whether a frame differs enough from the last analyzed one to be
+    worth another vision call. Frames are compared with the last *analyzed*
+    frame rather than the previous one, so a slow drift (clouds moving in)
+    still adds up to a change.
+
+    Parameters:
+    - method (str): "hash" (perceptual hash) or "histogram" (brightness histogram).
+    - threshold (float): Distance from 0.0 to 1.0 above which the scene counts as changed.
+    """
+
+    def __init__(self, method="hash", threshold=0.1):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {', '.join(METHODS)}")
+        self.signature, self.distance = METHODS[method]
+        self.threshold = threshold
+        self.reference = None
+
+    def compare(self, bytes_data):
+        """
+        (signature, distance) of a frame against the reference; distance is None for the first frame.
+        """
+        signature = self.signature(bytes_data)
+        if self.reference is None:
+            return signature, None
+        return signature, self.distance(self.reference, signature)
+
+    def changed(self, distance):
+        return distance is None or distance > self.threshold
+
+    def accept(self, signature):
+        # Called once a frame has been analyzed: it becomes what later frames are compared to
+        self.reference = signature
@@ -0,0 +1,141 @@
+import functools
+import importlib.util
+import os
+import random
+import time
+import httpx
+
+RETELL_BASE_URL = "https://api.retellai.com"
+
+# Per-endpoint budgets: Retell calls are small and should fail fast, vision calls upload images and think
+ENDPOINT_TIMEOUTS = {
+    "retell": httpx.Timeout(10.0, connect=3.0),
+    "openai": httpx.Timeout(120.0, connect=5.0),
+}
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Only these can be repeated safely if the server may already have acted on the first attempt
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+def pool_limits(max_connections=None):
+    # An explicit size (e.g. a batch job's concurrency) also keeps that many connections alive between requests
+    return httpx.Limits(
+        max_connections=max_connections or int(os.getenv('HTTP_MAX_CONNECTIONS', 20)),
+        max_keepalive_connections=max_connections or int(os.getenv('HTTP_MAX_KEEPALIVE', 10)),
+        keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60)),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_http_client(endpoint="retell"):
+    """
+    Keep-alive connection pool for one endpoint, created once per process.
+
+    Streamlit only re-executes the page script on rerun, so imported modules (and
+    this cache) survive across reruns and sessions.
+    """
+    return httpx.Client(
+        http2=http2_available(),
+        timeout=ENDPOINT_TIMEOUTS[endpoint],
+        limits=pool_limits(),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_http_client(endpoint="openai", max_connections=None):
+    # httpx async pools are tied to the event loop that first uses them: one loop per process
+    return httpx.AsyncClient(
+        http2=http2_available(),
+        timeout=ENDPOINT_TIMEOUTS[endpoint],
+        limits=pool_limits(max_connections),
+    )
+
+
+def backoff_delay(attempt, base_delay=0.5, max_delay=8.0):
+    # Full jitter: spread retries out instead of hammering the API in lockstep
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def request_with_retries(method, url, endpoint="retell", max_retries=3, **kwargs):
+    """
+    Send a request on the shared pool for `endpoint`, retrying transient failures.
+
+    Connection errors are always retried because the request never reached the
+    server. Retryable status codes are only retried for idempotent methods, plus
+    429 which means the request was rejected outright.
+    """
+    client = get_http_client(endpoint)
+    method = method.upper()
+    for attempt in range(max_retries + 1):
+        try:
+            response = client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt == max_retries:
+                raise
+        except httpx.RemoteProtocolError:
+            # Usually a stale keep-alive connection, but the server may have seen the request
+            if method not in IDEMPOTENT_METHODS or attempt == max_retries:
+                raise
+        else:
+            retryable = response.status_code == 429 or (
+                response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS
+            )
+            if not retryable or attempt == max_retries:
+                return response
+        time.sleep(backoff_delay(attempt))
+
+
+def retell_headers(api_key=None):
+    return {
+        "Authorization": f"Bearer {api_key or os.getenv('RETELL_API_KEY')}",
+        "Content-Type": "application/json",
+    }
+
+
+def create_web_call(agent_id, metadata=None, api_key=None, **fields):
+    body = {"agent_id": agent_id, **fields}
+    if metadata is not None:
+        body["metadata"] = metadata
+    return request_with_retries(
+        "POST", f"{RETELL_BASE_URL}/v2/create-web-call", headers=retell_headers(api_key), json=body
+    )
+
+
+def update_call(call_id, api_key=None, **fields):
+    # e.g. metadata or override_dynamic_variables, for information that was not ready at creation
+    return request_with_retries(
+        "PATCH", f"{RETELL_BASE_URL}/v2/update-call/{call_id}", headers=retell_headers(api_key), json=fields
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_chat_model(model_name, openai_api_key=None, max_retries=2, max_connections=None):
+    """
+    Shared ChatOpenAI on the process-wide OpenAI pools.
+
+    Parameters:
+    - max_connections (int): Size the async pool for this many requests in flight
+      (e.g. batch_analyze.py's --concurrency) instead of HTTP_MAX_CONNECTIONS.
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=model_name,
+        openai_api_key=openai_api_key or os.getenv('OPENAI_API_KEY'),
+        max_retries=max_retries,
+        timeout=ENDPOINT_TIMEOUTS["openai"],
+        http_client=get_http_client("openai"),
+        http_async_client=get_async_http_client("openai", max_connections),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_retell_client():
+    from retell import Retell
+    return Retell(
+        api_key=os.getenv('RETELL_API_KEY'),
+        http_client=get_http_client("retell"),
+    )
@@ -0,0 +1,155 @@
+import base64
+import io
+import math
+import os
+from PIL import Image
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+# GPT-4o vision pricing model: a flat cost for low detail, otherwise 512px tiles
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """
+    Estimate the prompt tokens GPT-4o charges for an image of the given size.
+    """
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    # Fit within 2048x2048, then scale so the shortest side is at most 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * tiles
+
+
+def choose_detail(width, height, detail="auto"):
+    if detail != "auto":
+        return detail
+    # A single low-detail pass sees the image at 512px, so anything that small gains nothing from tiles
+    return "low" if max(width, height) <= 512 else "high"
+
+
+def preprocess_settings_from_env():
+    return {
+        "max_edge": int(os.getenv('IMAGE_MAX_EDGE', 1024)),
+        "image_format": os.getenv('IMAGE_FORMAT', "JPEG").upper(),
+        "quality": int(os.getenv('IMAGE_QUALITY', 85)),
+        "detail": os.getenv('IMAGE_DETAIL', "auto"),
+    }
+
+
+class PreparedImage:
+    def __init__(self, data, image_format, width, height, detail, original_width, original_height,
+                 original_format, original_mode, original_bytes):
+        self.data = data
+        self.image_format = image_format
+        self.width = width
+        self.height = height
+        self.detail = detail
+        self.original_width = original_width
+        self.original_height = original_height
+        self.original_format = original_format
+        self.original_mode = original_mode
+        self.original_bytes = original_bytes
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.image_format]
+
+    @property
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+    @property
+    def tokens(self):
+        return estimate_image_tokens(self.width, self.height, self.detail)
+
+    @property
+    def original_tokens(self):
+        return estimate_image_tokens(self.original_width, self.original_height, "high")
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - len(self.data)
+
+    @property
+    def tokens_saved(self):
+        return self.original_tokens - self.tokens
+
+    def summary(self):
+        return (
+            f"Sent {self.width}x{self.height} {self.image_format} ({len(self.data) / 1024:.0f} KB, "
+            f"~{self.tokens} tokens, detail={self.detail}); saved {self.bytes_saved / 1024:.0f} KB "
+            f"and ~{self.tokens_saved} tokens"
+        )
+
+
+def read_image_info(bytes_data):
+    """
+    (width, height, format, mode) of an image, from its header alone: nothing is decoded.
+    """
+    with Image.open(io.BytesIO(bytes_data)) as im:
+        return im.size[0], im.size[1], im.format, im.mode
+
+
+def preprocess_image(bytes_data, max_edge=1024, image_format="JPEG", quality=85, detail="auto"):
+    """
+    Decode an uploaded image once, downsample it and re-encode it for the vision model.
+    An upload that already fits within `max_edge`, in a format the model accepts,
+    is sent as is when re-encoding would not make it smaller.
+
+    Parameters:
+    - bytes_data (bytes): The raw upload.
+    - max_edge (int): The longest side of the image sent to the model.
+    - image_format (str): "JPEG", "WEBP" or "PNG" (re-encoded losslessly, so rarely smaller).
+    - quality (int): Encoder quality for lossy formats.
+    - detail (str): "low", "high" or "auto" to pick from the downsampled size.
+    """
+    image_format = image_format.upper()
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    with Image.open(io.BytesIO(bytes_data)) as im:
+        original_size = im.size
+        original_format = im.format
+        original_mode = im.mode
+        # Let the JPEG decoder skip straight to a reduced scale instead of decoding full resolution
+        im.draft("RGB", (max_edge, max_edge))
+        if max(im.size) > max_edge:
+            im.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if image_format == "JPEG" and im.mode != "RGB":
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA", "L"):
+            im = im.convert("RGBA" if "A" in im.mode else "RGB")
+
+        buffer = io.BytesIO()
+        options = {"quality": quality} if image_format in ("JPEG", "WEBP") else {}
+        if image_format == "JPEG":
+            options["optimize"] = True
+        im.save(buffer, format=image_format, **options)
+        size = im.size
+
+    data = buffer.getvalue()
+    if max(original_size) <= max_edge and original_format in MIME_TYPES and len(bytes_data) <= len(data):
+        data, image_format = bytes_data, original_format
+
+    return PreparedImage(
+        data=data,
+        image_format=image_format,
+        width=size[0],
+        height=size[1],
+        detail=choose_detail(size[0], size[1], detail),
+        original_width=original_size[0],
+        original_height=original_size[1],
+        original_format=original_format,
+        original_mode=original_mode,
+        original_bytes=len(bytes_data),
+    )
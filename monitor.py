@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from analysis_cache import AnalysisCache
+from batch_analyze import IMAGE_EXTENSIONS
+from change_detection import METHODS, ChangeDetector
+from clients import get_chat_model
+from vision import VISION_MODEL, WEATHER_PROMPT, analyze_image
+load_dotenv()
+
+
+# Capture time in a frame's file name: 20240501T120000, 2024-05-01_12-00-00, ... or Unix seconds/milliseconds
+NAME_DATETIME = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})[T_ -]?(\d{2})[-_:]?(\d{2})[-_:]?(\d{2})")
+NAME_EPOCH = re.compile(r"(?<!\d)(\d{10}|\d{13})(?!\d)")
+
+
+def frame_timestamp(path):
+    """
+    When a frame was captured: from its file name where that names a time
+    (local time), otherwise its modification time, which a copy or restore can reset.
+    """
+    name = os.path.basename(path)
+    match = NAME_DATETIME.search(name)
+    if match:
+        try:
+            return datetime(*map(int, match.groups())).timestamp()
+        except ValueError:
+            pass
+    match = NAME_EPOCH.search(name)
+    if match:
+        return int(match.group(1)) / (1000 if len(match.group(1)) == 13 else 1)
+    return os.path.getmtime(path)
+
+
+def iter_folder_frames(directory, interval, follow=False, poll_interval=1.0):
+    """
+    (frame_id, timestamp, bytes) for frames in a folder, in file name order, at
+    most one per `interval` seconds of capture time (see frame_timestamp).
+    Frames skipped for the interval are yielded too, with None for bytes, so
+    they can be logged. With `follow`, keep watching the folder for new frames.
+    """
+    seen = set()
+    last_sampled = None
+    while True:
+        names = sorted(
+            name for name in os.listdir(directory)
+            if name.lower().endswith(IMAGE_EXTENSIONS) and name not in seen
+        )
+        for name in names:
+            seen.add(name)
+            path = os.path.join(directory, name)
+            timestamp = frame_timestamp(path)
+            # A timestamp that goes backwards (a reset clock) starts a new sequence rather than being skipped
+            if last_sampled is not None and 0 <= timestamp - last_sampled < interval:
+                yield path, timestamp, None
+                continue
+            last_sampled = timestamp
+            with open(path, "rb") as f:
+                yield path, timestamp, f.read()
+        if not follow:
+            return
+        time.sleep(poll_interval)
+
+
+def iter_camera_frames(source, interval):
+    """
+    (frame_id, timestamp, JPEG bytes) from a camera index or stream URL, one every `interval` seconds.
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise SystemExit("Reading a camera feed needs OpenCV: pip install opencv-python-headless")
+    capture = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open camera feed {source}")
+    index = 0
+    next_sample = time.monotonic()
+    try:
+        while True:
+            # Keep draining the feed so the sampled frame is current, not one buffered seconds ago
+            if not capture.grab():
+                return
+            if time.monotonic() < next_sample:
+                continue
+            next_sample += interval
+            ok, frame = capture.retrieve()
+            if not ok:
+                continue
+            ok, encoded = cv2.imencode(".jpg", frame)
+            if ok:
+                index += 1
+                yield f"{source}#{index}", time.time(), encoded.tobytes()
+    finally:
+        capture.release()
+
+
+class FrameMonitor:
+    """
+    Describes the weather in a stream of frames, calling the vision model only
+    when the scene changed since the last analyzed frame (or the description is
+    older than `max_age` seconds). Every frame gets a record saying whether it
+    was analyzed or skipped, and why; frames passed without bytes were skipped
+    by the sampling interval.
+    """
+
+    def __init__(self, model, detector, cache, prompt=WEATHER_PROMPT, max_age=None):
+        self.model = model
+        self.detector = detector
+        self.cache = cache
+        self.prompt = prompt
+        self.max_age = max_age
+        self.description = None
+        self.analyzed_at = None
+        self.counts = {"analyzed": 0, "skipped": 0}
+
+    def process(self, frame_id, timestamp, bytes_data):
+        if bytes_data is None:
+            self.counts["skipped"] += 1
+            return {"frame": frame_id, "timestamp": timestamp, "action": "skipped", "reason": "interval"}
+        signature, distance = self.detector.compare(bytes_data)
+        if distance is None:
+            reason = "first"
+        elif self.detector.changed(distance):
+            reason = "changed"
+        elif self.max_age and not 0 <= timestamp - self.analyzed_at < self.max_age:
+            reason = "stale"
+        else:
+            reason = None
+
+        record = {
+            "frame": frame_id,
+            "timestamp": timestamp,
+            "distance": None if distance is None else round(distance, 4),
+        }
+        if reason is None:
+            self.counts["skipped"] += 1
+            record.update(action="skipped", reason="unchanged", description=self.description)
+            return record
+
+        started = time.perf_counter()
+        self.description = analyze_image(self.model, bytes_data, self.cache, self.prompt)
+        self.detector.accept(signature)
+        self.analyzed_at = timestamp
+        self.counts["analyzed"] += 1
+        record.update(
+            action="analyzed",
+            reason=reason,
+            seconds=round(time.perf_counter() - started, 2),
+            description=self.description,
+        )
+        return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor the weather from a camera feed, skipping unchanged frames.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--directory", help="Folder of timestamped frames")
+    source.add_argument("--camera", help="Camera index or stream URL (needs OpenCV)")
+    parser.add_argument("--follow", action="store_true", help="Keep watching --directory for new frames")
+    parser.add_argument("--interval", type=float, default=float(os.getenv('MONITOR_INTERVAL', 10)),
+                        help="Seconds between sampled frames")
+    parser.add_argument("--method", choices=sorted(METHODS), default=os.getenv('MONITOR_METHOD', "hash"))
+    parser.add_argument("--threshold", type=float, default=float(os.getenv('MONITOR_THRESHOLD', 0.1)),
+                        help="Change (0-1) above which a frame is sent to the model")
+    parser.add_argument("--max-age", type=float, default=float(os.getenv('MONITOR_MAX_AGE', 0)),
+                        help="Re-analyze after this many seconds even without a change (0: never)")
+    parser.add_argument("--output", help="JSONL log of every frame and whether it was analyzed")
+    parser.add_argument("--model", default=VISION_MODEL)
+    args = parser.parse_args(argv)
+
+    model = get_chat_model(args.model)
+    monitor = FrameMonitor(
+        model,
+        ChangeDetector(args.method, args.threshold),
+        AnalysisCache.from_env(),
+        max_age=args.max_age or None,
+    )
+    frames = (
+        iter_folder_frames(args.directory, args.interval, follow=args.follow)
+        if args.directory else iter_camera_frames(args.camera, args.interval)
+    )
+
+    log = open(args.output, "a", encoding="utf-8") if args.output else None
+    try:
+        for frame_id, timestamp, bytes_data in frames:
+            try:
+                record = monitor.process(frame_id, timestamp, bytes_data)
+            except Exception as err:
+                record = {"frame": frame_id, "timestamp": timestamp, "action": "error", "error": str(err)}
+            if log:
+                log.write(json.dumps(record) + "\n")
+                log.flush()
+            if record["action"] != "skipped":
+                print(json.dumps(record))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log:
+            log.close()
+        total = sum(monitor.counts.values())
+        print(json.dumps({**monitor.counts, "frames": total}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
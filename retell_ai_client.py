@@ -1,10 +1,8 @@
-from retell import Retell
+from clients import get_retell_client
 import os
 
-client = Retell(
-    api_key="key_a44383eeb59170321d311be3f219",
-)
+client = get_retell_client()
 web_call_response = client.call.create_web_call(
-    agent_id="agent_272f318329a62259f8e9d8179f",
+    agent_id=os.getenv('RETELL_AGENT_ID', "agent_272f318329a62259f8e9d8179f"),
 )
-print(web_call_response.agent_id)
\ No newline at end of file
+print(web_call_response.agent_id)
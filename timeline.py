@@ -0,0 +1,54 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Timeline:
+    """
+    Start and end of each stage of one capture-to-call run, in milliseconds
+    since the run began. Stages may run on other threads and overlap.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end):
+        # start and end are time.perf_counter() values
+        with self._lock:
+            self.stages.append({
+                "stage": name,
+                "start_ms": round((start - self.started) * 1000, 1),
+                "end_ms": round((end - self.started) * 1000, 1),
+            })
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def records(self):
+        with self._lock:
+            return sorted(self.stages, key=lambda record: record["start_ms"])
+
+    def critical_path(self):
+        """
+        Stage names on the longest chain: from the stage that finished last,
+        step back to whichever stage finished last before it started.
+        """
+        records = self.records()
+        if not records:
+            return []
+        current = max(records, key=lambda record: record["end_ms"])
+        path = [current]
+        while True:
+            before = [record for record in records if record["end_ms"] <= current["start_ms"]]
+            if not before:
+                break
+            current = max(before, key=lambda record: record["end_ms"])
+            path.append(current)
+        return [record["stage"] for record in reversed(path)]
@@ -1,12 +1,12 @@
 import streamlit as st
 # from openai import OpenAI
-from PIL import Image
-import base64
-from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
+from analysis_cache import AnalysisCache
+from clients import get_chat_model, request_with_retries
+from image_preprocess import read_image_info
+from vision import VISION_MODEL, stream_analysis
 import os
 from dotenv import load_dotenv
-import requests
+import httpx
 import json
 load_dotenv()
 
@@ -18,6 +18,11 @@ with st.sidebar:
     "[View the source code](https://github.com/streamlit/llm-examples/blob/main/Chatbot.py)"
     "[![Open in GitHub Codespaces](https://github.com/codespaces/badge.svg)](https://codespaces.new/streamlit/llm-examples?quickstart=1)"
 
+@st.cache_resource
+def get_analysis_cache():
+    # One cache per process, shared by every session and rerun
+    return AnalysisCache.from_env()
+
 _size = st.empty()
 _mode = st.empty()
 _format = st.empty()
@@ -31,37 +36,41 @@ if uploaded_file is not None:
  
     st.image(uploaded_file)
  
-    # Show Image property
-    im = Image.open(uploaded_file)
-    # im.show()
-    _size.markdown(f"<h6>Image size : {str(im.size)}</h6>", unsafe_allow_html=True)
-    _mode.text("Image mode : " + str(im.mode))
-    _format.text("Image mode : " + str(im.format))
-    
-    image_base64 = base64.b64encode(bytes_data).decode("utf-8")
-    # _content.markdown(f"<h6>Image content : {image_base64}</h6>", unsafe_allow_html=True)
- 
-    model = ChatOpenAI(model="gpt-4o", openai_api_key=openai_api_key)
- 
-    message = HumanMessage(
-        content=[
-            {"type": "text", "text": "describe the weather in this image"},
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
-            },
-        ],
-    )
-    response = model.invoke([message])
+    # Only the header is read here; the image is decoded and downsampled only if its analysis is not cached
+    width, height, image_format, image_mode = read_image_info(bytes_data)
+    _size.markdown(f"<h6>Image size : {str((width, height))}</h6>", unsafe_allow_html=True)
+    _mode.text("Image mode : " + str(image_mode))
+    _format.text("Image mode : " + str(image_format))
+
+    model = get_chat_model(VISION_MODEL, openai_api_key)
+
+    # Reruns (and repeat frames) hit the cache instead of re-sending the image
+    analysis_cache = get_analysis_cache()
     st.write("Image Analysis:")
-    st.write(response.content)
+    _analysis = st.empty()
+    timings = {}
+    analysis = ""
+    for token in stream_analysis(model, bytes_data, analysis_cache, timings=timings,
+                                 on_prepared=lambda prepared: _content.caption(prepared.summary())):
+        analysis += token
+        _analysis.markdown(analysis)
+
+    cache_stats = analysis_cache.stats()
+    st.sidebar.caption(f"Analysis cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    st.sidebar.caption(
+        f"Last analysis: first token {timings.get('ttft', 0):.2f}s, total {timings.get('total', 0):.2f}s"
+        + (" (cached)" if timings.get('cached') else "")
+    )
+    # Keep a short per-session history so slow requests can be spotted
+    st.session_state.setdefault('analysis_timings', []).append(timings)
+    del st.session_state['analysis_timings'][:-50]
 
 # Assuming you have a Retell AI API key
 retell_ai_api_key = os.getenv('RETELL_AI_API_KEY')
 
 # Prepare the data for the Retell AI API call
 retell_ai_data = {
-    "context": response.content,
+    "context": analysis,
     # Add any other parameters required by the Retell AI API
 }
 
@@ -73,7 +82,7 @@ headers = {
 }
 
 try:
-    retell_ai_response = requests.post(retell_ai_url, headers=headers, data=json.dumps(retell_ai_data))
+    retell_ai_response = request_with_retries("POST", retell_ai_url, headers=headers, content=json.dumps(retell_ai_data))
     retell_ai_response.raise_for_status()  # Raise an exception for bad status codes
     
     # Parse the Retell AI response
@@ -82,7 +91,7 @@ try:
     # Display the Retell AI result
     st.write("Retell AI Analysis:")
     st.write(retell_ai_result)
-except requests.exceptions.RequestException as e:
+except httpx.HTTPError as e:
     st.error(f"Error making request to Retell AI: {e}")
 except json.JSONDecodeError:
     st.error("Error decoding response from Retell AI")
\ No newline at end of file
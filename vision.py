@@ -0,0 +1,94 @@
+import time
+from langchain_core.messages import HumanMessage
+from analysis_cache import make_cache_key
+from image_preprocess import preprocess_image, preprocess_settings_from_env
+
+WEATHER_PROMPT = "describe the weather in this image"
+VISION_MODEL = "gpt-4o"
+
+
+def build_vision_message(image_url, prompt=WEATHER_PROMPT, detail=None):
+    image_url_part = {"url": image_url}
+    if detail:
+        image_url_part["detail"] = detail
+    return HumanMessage(
+        content=[
+            {"type": "text", "text": prompt},
+            {
+                "type": "image_url",
+                "image_url": image_url_part,
+            },
+        ],
+    )
+
+
+def analysis_cache_key(bytes_data, prompt, model_name, preprocess_settings):
+    # The raw upload plus how it would be preprocessed, so a hit needs no decoding at all
+    settings = ",".join(f"{name}={value}" for name, value in sorted(preprocess_settings.items()))
+    return make_cache_key(bytes_data, prompt, model_name, extra=settings)
+
+
+def analyze_image(model, bytes_data, cache, prompt=WEATHER_PROMPT, preprocess_settings=None):
+    """
+    Describe an image with the vision model, skipping the call (and the
+    preprocessing) when the same image/prompt/model combination was already analyzed.
+
+    Parameters:
+    - model (ChatOpenAI): The vision model.
+    - bytes_data (bytes): The image as uploaded/captured; it is only preprocessed on a cache miss.
+    - cache (AnalysisCache): Where previous analyses are kept.
+    - preprocess_settings (dict): preprocess_image() arguments, from the environment by default.
+    """
+    settings = preprocess_settings or preprocess_settings_from_env()
+    key = analysis_cache_key(bytes_data, prompt, model.model_name, settings)
+
+    def compute():
+        prepared = preprocess_image(bytes_data, **settings)
+        return model.invoke([build_vision_message(prepared.data_url, prompt, prepared.detail)]).content
+    return cache.get_or_compute(key, compute)
+
+
+def stream_analysis(model, bytes_data, cache, prompt=WEATHER_PROMPT, timings=None, preprocess_settings=None,
+                    on_prepared=None):
+    """
+    Same as analyze_image, but yields the description as tokens arrive.
+
+    `timings` (dict) is filled with the time to first token and total latency in
+    seconds, the preprocessing time on a miss, and whether the answer came from
+    the cache. `on_prepared`, if given, is called with the PreparedImage before
+    it is sent. The analysis is only cached once the stream has been consumed to
+    the end, and only if it is non-empty and the model finished it (not cut off
+    by a length limit or content filter).
+    """
+    timings = timings if timings is not None else {}
+    settings = preprocess_settings or preprocess_settings_from_env()
+    started = time.perf_counter()
+    key = analysis_cache_key(bytes_data, prompt, model.model_name, settings)
+    content = cache.get(key)
+    if content:
+        timings.update(cached=True, ttft=time.perf_counter() - started, total=time.perf_counter() - started)
+        yield content
+        return
+
+    # Decode once, downsample and re-encode before anything is sent to the model
+    prepared = preprocess_image(bytes_data, **settings)
+    timings["preprocess"] = time.perf_counter() - started
+    if on_prepared is not None:
+        on_prepared(prepared)
+
+    parts = []
+    finish_reason = None
+    for chunk in model.stream([build_vision_message(prepared.data_url, prompt, prepared.detail)]):
+        finish_reason = (getattr(chunk, "response_metadata", None) or {}).get("finish_reason") or finish_reason
+        if not chunk.content:
+            continue
+        if not parts:
+            timings["ttft"] = time.perf_counter() - started
+        parts.append(chunk.content)
+        yield chunk.content
+
+    content = "".join(parts)
+    # Only a complete, non-empty description is worth serving to every later rerun
+    if content.strip() and finish_reason in (None, "stop"):
+        cache.set(key, content)
+    timings.update(cached=False, total=time.perf_counter() - started)
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import queue
+import random
+import threading
+import time
+import websockets
+from websockets.exceptions import InvalidURI
+
+# Where the call's websocket lives; {call_id} is filled in from the create-web-call response
+RETELL_WEB_CALL_WS_URL = os.getenv('RETELL_WEB_CALL_WS_URL', "wss://api.retellai.com/audio-websocket/{call_id}")
+# Handshake statuses worth another attempt; any other 4xx (bad token, unknown call) will not fix itself
+TRANSIENT_STATUS_CODES = (408, 429)
+
+
+def is_transient(err):
+    if isinstance(err, InvalidURI):
+        return False
+    # InvalidStatusCode (websockets < 14) carries status_code, InvalidStatus its response
+    status = getattr(err, "status_code", None) or getattr(getattr(err, "response", None), "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES or status >= 500
+    return True
+
+
+class WebCallConnection:
+    """
+    One web call's websocket, kept open (and reopened with backoff) on the
+    manager's event loop until the call ends or `close()` is called.
+
+    Incoming messages land in a bounded queue; when the UI falls behind the
+    oldest messages are dropped, so a busy call cannot grow memory.
+
+    Errors that retrying cannot fix (a rejected token, a bad URL) end the
+    connection at once, and other errors after `max_retries` failed attempts
+    in a row; `status` is then "failed".
+    """
+
+    def __init__(self, call_id, access_token, url, max_queue=200, max_backoff=10.0, max_retries=8):
+        self.call_id = call_id
+        self.access_token = access_token
+        self.url = url
+        self.messages = queue.Queue(maxsize=max_queue)
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.status = "connecting"
+        self.error = None
+        self.reconnects = 0
+        self.dropped = 0
+        self.task = None
+        # time.perf_counter() when the socket first opened, for timing the call setup
+        self.opened_at = None
+        # time.monotonic() of the last poll(), so the manager can forget unread messages of ended calls
+        self.last_polled = time.monotonic()
+        # Optional callable: False once whoever opened the call (e.g. a browser session) is gone
+        self.owner_alive = None
+
+    async def run(self):
+        backoff = 0.5
+        failures = 0
+        while True:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    await ws.send(json.dumps({"type": "connect", "access_token": self.access_token}))
+                    self.status = "connected"
+                    if self.opened_at is None:
+                        self.opened_at = time.perf_counter()
+                    backoff = 0.5
+                    failures = 0
+                    async for message in ws:
+                        self._put(message)
+                # The server closed the socket cleanly: the call is over
+                self.status = "closed"
+                return
+            except asyncio.CancelledError:
+                self.status = "closed"
+                raise
+            except Exception as err:
+                self.error = str(err)
+                failures += 1
+                if not is_transient(err) or failures > self.max_retries:
+                    self.status = "failed"
+                    print(f"Web call {self.call_id} websocket failed after {failures} attempt(s): {err}")
+                    return
+                self.status = "reconnecting"
+                self.reconnects += 1
+                print(f"Web call {self.call_id} websocket error, reconnecting in {backoff:.1f}s: {err}")
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _put(self, message):
+        while True:
+            try:
+                self.messages.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.messages.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def poll(self, max_messages=100):
+        """
+        Messages received since the last poll, without waiting for new ones.
+        """
+        self.last_polled = time.monotonic()
+        messages = []
+        while len(messages) < max_messages:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    @property
+    def alive(self):
+        return self.task is not None and not self.task.done()
+
+
+class WebCallConnectionManager:
+    """
+    Runs every web-call websocket on one long-lived event loop in a background
+    thread, so a Streamlit rerun never blocks on a socket and never opens a
+    second connection for a call that already has one.
+
+    Every `prune_interval` seconds, live calls whose owner is gone (see
+    connect()) are closed, and ended calls are forgotten once their messages
+    are read or nobody has polled them for `idle_timeout` seconds. A live call
+    is never closed just because nobody polled it: the UI only polls on a rerun.
+    """
+
+    def __init__(self, url=RETELL_WEB_CALL_WS_URL, max_queue=200, idle_timeout=None, prune_interval=30.0):
+        self.url = url
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout or float(os.getenv('WEB_CALL_IDLE_TIMEOUT', 300))
+        self.prune_interval = prune_interval
+        self.connections = {}
+        self._lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="web-call-sockets", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._prune_periodically(), self.loop)
+
+    async def _prune_periodically(self):
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            self.prune()
+
+    def connect(self, call_id, access_token, owner_alive=None):
+        """
+        The connection for `call_id`, opening it only if there is no live one yet.
+
+        Parameters:
+        - owner_alive (callable): Returns False once the call's owner (e.g. its
+          Streamlit session) has gone away, so the call can be hung up.
+        """
+        if not call_id or not access_token:
+            raise ValueError("Missing call_id or access_token in the create-web-call response")
+        self.prune()
+        with self._lock:
+            connection = self.connections.get(call_id)
+            if connection is not None and connection.alive:
+                return connection
+            connection = WebCallConnection(call_id, access_token, self.url.format(call_id=call_id), self.max_queue)
+            connection.owner_alive = owner_alive
+            connection.task = asyncio.run_coroutine_threadsafe(connection.run(), self.loop)
+            self.connections[call_id] = connection
+            return connection
+
+    def get(self, call_id):
+        return self.connections.get(call_id)
+
+    def close(self, call_id):
+        with self._lock:
+            connection = self.connections.pop(call_id, None)
+        if connection is not None and connection.task is not None:
+            # Cancelling the future cancels the task on the loop, which closes the socket
+            connection.task.cancel()
+
+    def prune(self):
+        """
+        Close live connections whose owner has gone, and forget ended ones whose
+        messages have all been read or have gone unpolled for `idle_timeout` seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for call_id in [
+                call_id for call_id, connection in self.connections.items()
+                if not connection.alive
+                and (connection.messages.empty() or now - connection.last_polled > self.idle_timeout)
+            ]:
+                del self.connections[call_id]
+            orphaned = [
+                call_id for call_id, connection in self.connections.items()
+                if connection.owner_alive is not None and not self._owner_alive(connection)
+            ]
+        for call_id in orphaned:
+            print(f"Closing web call {call_id}: the session that opened it has ended")
+            self.close(call_id)
+
+    @staticmethod
+    def _owner_alive(connection):
+        try:
+            return connection.owner_alive()
+        except Exception as err:
+            print(f"Could not check the owner of web call {connection.call_id}: {err}")
+            return True